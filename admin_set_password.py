@@ -27,7 +27,8 @@ def write(data, sha=None):
          "content": base64.b64encode(json.dumps(data, indent=2).encode()).decode()}
     if sha: p["sha"] = sha
     r = requests.put(url(), headers=hdrs(), json=p)
-    print("✅ Password updated." if r.status_code in (200,201) else f"❌ {r.status_code}: {r.text}")
+    print("✅ Password updated (the app picks it up within 5 minutes)." if r.status_code in (200,201)
+          else f"❌ {r.status_code}: {r.text}")
 
 if __name__ == "__main__":
     if not GITHUB_TOKEN or not GITHUB_REPO:
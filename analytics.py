@@ -0,0 +1,200 @@
+"""
+Attendance analytics over many sessions.
+
+Sessions are fetched like exports.build_zip (a bounded pool) through the
+storage blob cache, so an ended session is downloaded and parsed once, then
+stacked into one frame with a row per (session, student), keyed by matric.
+Everything after loading is a group-by or a merge on that frame.
+
+    data = analytics.load_cohort(school, dept, level)
+    rates = analytics.attendance_rates(data)        # per student and course
+    counts = analytics.session_counts(data)         # per session
+    late = analytics.lateness(data)                 # minutes-late histogram
+"""
+
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import storage
+from futo_data import ATTENDANCES_ROOT, COHORTS, cohort_for, cohort_label
+
+
+ANALYTICS_WORKERS = 4  # concurrent downloads, as for exports
+LATE_BINS   = (0, 5, 10, 15, 20, 30, 45, 60, float("inf"))  # minutes after the session started
+LATE_LABELS = ("0–5", "5–10", "10–15", "15–20", "20–30", "30–45", "45–60", "60+")
+
+SESSION_COLUMNS = ["session", "cohort", "course_code", "date", "start_time", "started"]
+ENTRY_COLUMNS   = ["session", "matric", "surname", "first_name", "middle_name", "signed_at"]
+
+
+class Attendance(NamedTuple):
+    sessions: pd.DataFrame  # one row per session, SESSION_COLUMNS
+    entries: pd.DataFrame   # one row per sign-in, ENTRY_COLUMNS + the session's columns
+
+
+def _cohort_labels():
+    labels = {}
+    for c in COHORTS.values():
+        labels[c.dir] = labels[f"{ATTENDANCES_ROOT}/{c.id}"] = cohort_label(c)
+    return labels
+
+
+def _archive_label(school, dept, level):
+    """cohort_label() for archived names; folder names outside the catalog are shown as they are."""
+    c = cohort_for(school, dept, level)
+    return cohort_label(c) if c is not None else f"{school} · {dept} · {level}L"
+
+
+def _course_key(code):
+    return "".join(code.split()).replace("_", "").upper()
+
+
+def _frame(row, blob):
+    """The session's parsed entries (storage.Blob) as a frame with ENTRY_COLUMNS."""
+    if not blob or not blob.entries:
+        return None
+    df = pd.DataFrame(blob.entries, dtype=str).fillna("").rename(columns={"timestamp": "signed_at"})
+    df["session"] = row["path"]
+    return df.reindex(columns=ENTRY_COLUMNS, fill_value="")
+
+
+def load(rows, workers=ANALYTICS_WORKERS):
+    """Attendance for the given manifest rows (storage.list_sessions format)."""
+    labels = _cohort_labels()
+    sessions = pd.DataFrame([{
+        "session": r["path"],
+        "cohort": labels.get(r["path"].rsplit("/", 1)[0], r["path"].rsplit("/", 1)[0]),
+        "course_code": r.get("course_code", ""), "date": r.get("date", ""),
+        "start_time": r.get("start_time", ""),
+    } for r in rows], columns=SESSION_COLUMNS[:-1])
+    sessions["started"] = pd.to_datetime(
+        sessions["date"] + " " + sessions["start_time"].str.replace("-", ":"), errors="coerce")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = [f for f in map(_frame, rows, pool.map(storage.read_session_blob, rows)) if f is not None]
+    entries = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ENTRY_COLUMNS)
+    return _attendance(sessions, entries)
+
+
+def _attendance(sessions, entries):
+    entries["matric"] = entries["matric"].str.strip().str.upper()
+    entries = entries[entries["matric"] != ""].drop_duplicates(["session", "matric"])
+    entries = entries.merge(sessions, on="session", how="left")
+    entries["signed_at"] = pd.to_datetime(entries["signed_at"], errors="coerce")
+    entries["minutes_late"] = (entries["signed_at"] - entries["started"]).dt.total_seconds() / 60
+    return Attendance(sessions, entries.reset_index(drop=True))
+
+
+def load_cohort(school, dept, level, courses=None, workers=ANALYTICS_WORKERS):
+    """Every session of one cohort, optionally only the given course codes."""
+    rows = storage.list_sessions(school, dept, level)
+    if courses:
+        keys = {_course_key(c) for c in courses}
+        rows = [r for r in rows if _course_key(r.get("course_code", "")) in keys]
+    return load(rows, workers)
+
+
+def load_course(course_code, workers=ANALYTICS_WORKERS):
+    """
+    Every session of one course code across all cohorts, found in one
+    listing of the data repo. Sessions still running count with no entries.
+    """
+    key = _course_key(course_code)
+    rows = []
+    for path, sha in storage.list_blobs(ATTENDANCES_ROOT + "/").items():
+        if not path.endswith(".csv"):
+            continue
+        try:
+            row = dict(path=path, sha=sha, **storage.parse_csv_name(path))
+        except ValueError:
+            continue
+        if _course_key(row["course_code"]) == key:
+            rows.append(row)
+    return load(sorted(rows, key=lambda r: r["path"], reverse=True), workers)
+
+
+def load_archive(path, school=None, dept=None, level=None, courses=None):
+    """
+    Attendance from a Parquet archive written by archive.py, optionally
+    narrowed to one school, department, level and/or course codes. Only the
+    matching partitions are read, so a whole semester loads in seconds.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import archive
+
+    index = archive.read_index(path)
+    index = index[index["school"].notna()]  # sessions the archive skipped (no cohort folder)
+    wanted = {"school": school, "dept": dept, "level": level}
+    for col, value in wanted.items():
+        if value is not None:
+            index = index[index[col] == str(value)]
+    if courses:
+        keys = {_course_key(c) for c in courses}
+        index = index[index["course"].map(_course_key).isin(keys)]
+    sessions = pd.DataFrame({
+        "session": index["session"],
+        "cohort": [_archive_label(s, d, l) for s, d, l in zip(index["school"], index["dept"], index["level"])],
+        "course_code": index["course"], "date": index["date"], "start_time": index["start_time"],
+    }, columns=SESSION_COLUMNS[:-1]).reset_index(drop=True)
+    sessions["started"] = pd.to_datetime(
+        sessions["date"] + " " + sessions["start_time"].str.replace("-", ":"), errors="coerce")
+
+    files = [f"{path}/{f}" for f in index["file"].dropna().unique()]
+    if not files:
+        return _attendance(sessions, pd.DataFrame(columns=ENTRY_COLUMNS))
+    partitioning = ds.partitioning(pa.schema([(c, pa.string()) for c in archive.PARTITIONS]), flavor="hive")
+    table = ds.dataset(files, format="parquet", partitioning=partitioning, partition_base_dir=path).to_table(
+        columns=ENTRY_COLUMNS, filter=ds.field("session").isin(list(sessions["session"])))
+    entries = table.to_pandas()
+    entries["signed_at"] = entries["signed_at"].astype(str).replace("NaT", "")
+    return _attendance(sessions, entries)
+
+
+# ─── Aggregates ───────────────────────────────────────────────────────────────
+
+def attendance_rates(data):
+    """
+    Per student and course: sessions attended, sessions held and the rate
+    (percent). A student counts against every session of a course their
+    cohort held, so the denominator includes sessions they missed.
+    """
+    held = (data.sessions.groupby(["cohort", "course_code"])["session"].nunique()
+            .rename("sessions").reset_index())
+    attended = (data.entries.groupby(["matric", "cohort", "course_code"])
+                .agg(attended=("session", "nunique"), first_seen=("date", "min"), last_seen=("date", "max"))
+                .reset_index())
+    names = (data.entries.sort_values("signed_at")
+             .groupby("matric")[["surname", "first_name", "middle_name"]].last().reset_index())
+    out = attended.merge(held, on=["cohort", "course_code"], how="left").merge(names, on="matric", how="left")
+    out["rate"] = (100 * out["attended"] / out["sessions"]).round(1)
+    cols = ["matric", "surname", "first_name", "middle_name", "cohort", "course_code",
+            "attended", "sessions", "rate", "first_seen", "last_seen"]
+    return out[cols].sort_values(["course_code", "rate", "matric"], ascending=[True, False, True],
+                                 ignore_index=True)
+
+
+def session_counts(data):
+    """Per session: sign-ins and median minutes late, newest first."""
+    per = (data.entries.groupby("session")
+           .agg(students=("matric", "size"), median_minutes_late=("minutes_late", "median"))
+           .reset_index())
+    out = data.sessions.merge(per, on="session", how="left")
+    out["students"] = out["students"].fillna(0).astype(int)
+    out["median_minutes_late"] = out["median_minutes_late"].round(1)
+    return out.sort_values("started", ascending=False, ignore_index=True)
+
+
+def lateness(data, by="course_code"):
+    """Sign-ins per LATE_LABELS bucket of minutes after the start, per `by` value."""
+    late = data.entries.dropna(subset=["minutes_late"])
+    buckets = pd.cut(late["minutes_late"].clip(lower=0), bins=list(LATE_BINS),
+                     labels=list(LATE_LABELS), right=False)
+    return (late.assign(minutes=buckets).groupby([by, "minutes"], observed=False).size()
+            .unstack(by, fill_value=0))
+
+
+def rates_csv(rates):
+    return rates.to_csv(index=False)
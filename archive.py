@@ -0,0 +1,224 @@
+"""
+Semester archive — FUTO ULAS
+Run offline to collect every session CSV in the data repo into a Parquet
+dataset, partitioned by school, department, level and course:
+
+  <out>/school=<School>/dept=<Dept>/level=<Level>/course=<Course>/part-<run>.parquet
+  <out>/_sessions.parquet      # one row per archived session: path, blob sha, data file
+
+  export GITHUB_TOKEN="ghp_xxx"
+  export GITHUB_REPO="yourusername/futo-attendance-data"
+  python archive.py /srv/futo-archive
+
+Runs are incremental. One tree listing gives every CSV's blob sha; only
+sessions whose sha is not in _sessions.parquet yet (new, or rewritten since,
+e.g. a session that was still running last time) are downloaded, through the
+storage blob cache. A rewritten session's old rows are dropped from the file
+that held them. Sessions in a cohort folder the catalog no longer has are
+partitioned by its folder names; any other CSV is indexed without data so it
+is not downloaded again. Needs pyarrow (pip install pyarrow).
+
+Read it with analytics.load_archive(), or any Parquet reader using hive
+partitioning (directory names are URI-encoded).
+"""
+
+import os
+import sys
+import time
+import argparse
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import storage
+from futo_data import ATTENDANCES_ROOT, COHORTS
+
+
+ARCHIVE_WORKERS = 8                   # concurrent downloads; the tree listing is one call
+INDEX_FILE      = "_sessions.parquet"  # underscore: skipped by Parquet dataset discovery
+PARTITIONS      = ("school", "dept", "level", "course")
+INDEX_COLUMNS   = ["session", "sha", "file", *PARTITIONS, "date", "start_time", "entries", "archived_at"]
+DATA_COLUMNS    = ["session", "date", "start_time", "matric", "surname", "first_name", "middle_name",
+                   "signed_at"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        sys.exit("❌ The archive needs pyarrow: pip install pyarrow")
+
+
+def _cohort_dirs():
+    """Attendance folder (name or id layout) -> Cohort."""
+    dirs = {}
+    for c in COHORTS.values():
+        dirs[c.dir] = dirs[f"{ATTENDANCES_ROOT}/{c.id}"] = c
+    return dirs
+
+
+def _session_names(folder, cohorts):
+    """
+    (school, dept, level) for a session folder: the catalog names, or for a
+    folder outside the catalog (e.g. from an older catalog) the folder names
+    of its attendances/<school>/<dept>/<level>L path. None if neither fits.
+    """
+    c = cohorts.get(folder)
+    if c is not None:
+        return c.school, c.dept, c.level
+    parts = folder.split("/")
+    if len(parts) == 4 and parts[0] == ATTENDANCES_ROOT and parts[3].endswith("L"):
+        return parts[1], parts[2], parts[3][:-1]
+    return None
+
+
+def partition_dir(school, dept, level, course):
+    """Relative hive-style directory for one partition."""
+    values = zip(PARTITIONS, (school, dept, level, course))
+    return "/".join(f"{k}={quote(str(v), safe='')}" for k, v in values)
+
+
+def read_index(out_dir):
+    path = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    return pd.read_parquet(path)
+
+
+def _write_parquet(df, path, schema=None):
+    """Writes through a temp file so readers never see half a file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), tmp)
+    os.replace(tmp, path)
+
+
+def _data_schema():
+    import pyarrow as pa
+    return pa.schema([(c, pa.timestamp("s") if c == "signed_at" else pa.string()) for c in DATA_COLUMNS])
+
+
+def _drop_orphans(out_dir, index):
+    """Removes data files a crashed run left behind (written, but never indexed)."""
+    known = set(index["file"].dropna())
+    for dirpath, _, filenames in os.walk(out_dir):
+        for fn in filenames:
+            rel = os.path.relpath(os.path.join(dirpath, fn), out_dir).replace(os.sep, "/")
+            if fn.startswith("part-") and rel not in known:
+                os.remove(os.path.join(dirpath, fn))
+
+
+def _session_rows(todo, workers, log=print):
+    """
+    (index_row, entries frame) per session, downloaded by a bounded pool. A
+    session whose folder names no cohort is indexed with no data file (and
+    entries frame None), so later runs do not fetch it again.
+    """
+    cohorts = _cohort_dirs()
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        blobs = pool.map(lambda item: storage.read_blob(*item), todo)
+        for (path, sha), blob in zip(todo, blobs):
+            if blob is None:
+                continue
+            name = storage.parse_csv_name(path)
+            names = _session_names(path.rsplit("/", 1)[0], cohorts)
+            if names is None:
+                log(f"Skipped {path}: its folder is not a cohort")
+                rows.append((dict(session=path, sha=sha or storage.blob_sha(blob.content), file=None,
+                                  school=None, dept=None, level=None, course=name["course_code"],
+                                  date=name["date"], start_time=name["start_time"],
+                                  entries=len(blob.entries)), None))
+                continue
+            school, dept, level = names
+            df = pd.DataFrame(blob.entries, columns=["surname", "first_name", "middle_name", "matric",
+                                                     "timestamp"], dtype=str).fillna("")
+            df = df.rename(columns={"timestamp": "signed_at"}).assign(
+                session=path, date=name["date"], start_time=name["start_time"])
+            df["signed_at"] = pd.to_datetime(df["signed_at"], errors="coerce")
+            rows.append(({
+                "session": path, "sha": sha or storage.blob_sha(blob.content), "file": None,
+                "school": school, "dept": dept, "level": level,
+                "course": name["course_code"], "date": name["date"], "start_time": name["start_time"],
+                "entries": len(df),
+            }, df[DATA_COLUMNS]))
+    return rows
+
+
+def export(out_dir, workers=ARCHIVE_WORKERS, log=print):
+    """Brings the archive in `out_dir` up to date. Returns the number of sessions (re)archived."""
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    index = read_index(out_dir)
+    _drop_orphans(out_dir, index)
+    known = dict(zip(index["session"], index["sha"]))
+
+    listing = storage.list_blobs(ATTENDANCES_ROOT + "/")
+    todo = []
+    for path, sha in sorted(listing.items()):
+        if not path.endswith(".csv") or (sha and known.get(path) == sha):
+            continue
+        try:
+            storage.parse_csv_name(path)
+        except ValueError:
+            continue
+        todo.append((path, sha))
+    log(f"{len(listing)} files listed, {len(todo)} session CSV(s) to check")
+
+    rows = [(row, df) for row, df in _session_rows(todo, workers, log) if known.get(row["session"]) != row["sha"]]
+    if not rows:
+        log("Archive is up to date.")
+        return 0
+
+    # Rewritten sessions: drop their old rows wherever they were archived
+    changed = index[index["session"].isin([row["session"] for row, _ in rows])]
+    for rel, group in changed.dropna(subset=["file"]).groupby("file"):
+        path = os.path.join(out_dir, rel)
+        table = pq.read_table(path)
+        gone = pa.array(list(group["session"]), type=pa.string())
+        table = table.filter(pc.invert(pc.is_in(table["session"], value_set=gone)))
+        if table.num_rows:
+            tmp = f"{path}.tmp{os.getpid()}"
+            pq.write_table(table, tmp)
+            os.replace(tmp, path)
+        else:
+            os.remove(path)
+    index = index[~index["session"].isin(changed["session"])]
+
+    run = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    new_index = pd.DataFrame([row for row, _ in rows], columns=INDEX_COLUMNS)
+    new_index["archived_at"] = run[:15]
+    frames = [df.assign(_part=partition_dir(row["school"], row["dept"], row["level"], row["course"]))
+              for row, df in rows if df is not None]
+    data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[*DATA_COLUMNS, "_part"])
+    schema = _data_schema()
+    for part, df in data.groupby("_part"):
+        rel = f"{part}/part-{run}.parquet"
+        _write_parquet(df[DATA_COLUMNS], os.path.join(out_dir, rel), schema)
+        new_index.loc[new_index["session"].isin(df["session"]), "file"] = rel
+
+    index = pd.concat([index, new_index], ignore_index=True) if len(index) else new_index
+    _write_parquet(index.sort_values("session", ignore_index=True), os.path.join(out_dir, INDEX_FILE))
+    log(f"Archived {len(frames)} session(s), {len(data)} sign-ins, into {data['_part'].nunique()} partition(s).")
+    return len(frames)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Incremental Parquet archive of every attendance session.")
+    p.add_argument("out_dir", help="archive directory (created if missing)")
+    p.add_argument("--workers", type=int, default=ARCHIVE_WORKERS, help="concurrent downloads")
+    args = p.parse_args(argv)
+    start = time.monotonic()
+    export(args.out_dir, args.workers)
+    print(f"Done in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+A local stand-in for the parts of the GitHub REST API that github_storage
+uses: GET/PUT /repos/<owner>/<repo>/contents/<path> and
+GET /repos/<owner>/<repo>/git/trees/<branch>?recursive=1.
+
+It keeps files in memory with real git blob shas and answers like GitHub
+does: ETags with 304 on If-None-Match (not counted against the rate limit),
+409 on a stale sha, 422 when an existing file is written without one, and
+X-RateLimit-* headers on every response. On top of that it can add latency,
+fail a share of writes with 409 as if another writer got there first, and
+send secondary rate limits (429 + Retry-After).
+
+    server = FakeGitHub(latency=0.15, conflict_rate=0.05).start()
+    os.environ["GITHUB_API_URL"] = server.url
+"""
+
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
+
+
+def blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class FakeGitHub:
+    """
+    latency:        seconds added to every response
+    jitter:         up to this many extra seconds, uniformly
+    conflict_rate:  share of otherwise valid PUTs answered with 409
+    rate_limit:     X-RateLimit-Limit; at 0 remaining requests get 403
+    secondary_rate: share of requests answered with 429 + Retry-After
+    retry_after:    seconds sent in Retry-After
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, conflict_rate=0.0, rate_limit=5000,
+                 secondary_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.conflict_rate = conflict_rate
+        self.rate_limit = rate_limit
+        self.secondary_rate = secondary_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.files = {}  # path -> bytes
+        self.calls = Counter()  # "GET contents 200", "PUT contents 409", ...
+        self.remaining = rate_limit
+        self.min_remaining = rate_limit
+        self.reset_at = int(time.time()) + 3600
+        self._lock = threading.Lock()
+        self._server = None
+
+    # ─── Server ───────────────────────────────────────────────────────────────
+
+    def start(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake._handle(self, "GET")
+
+            def do_PUT(self):
+                fake._handle(self, "PUT")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "rate_remaining": self.remaining,
+                    "rate_min_remaining": self.min_remaining}
+
+    # ─── Requests ─────────────────────────────────────────────────────────────
+
+    def _handle(self, req, method):
+        length = int(req.headers.get("Content-Length") or 0)
+        body = req.rfile.read(length) if length else b""
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        url = urlsplit(req.path)
+        parts = url.path.strip("/").split("/", 4)
+        kind = parts[3] if len(parts) >= 4 and parts[0] == "repos" else "other"
+        rest = unquote(parts[4]) if len(parts) > 4 else ""
+
+        with self._lock:
+            if self.secondary_rate and self.random.random() < self.secondary_rate:
+                return self._reply(req, method, kind, 429,
+                                   {"message": "You have exceeded a secondary rate limit."},
+                                   {"Retry-After": str(self.retry_after)})
+            if self.remaining <= 0:
+                return self._reply(req, method, kind, 403, {"message": "API rate limit exceeded"})
+
+            if method == "GET" and kind == "contents":
+                return self._get_contents(req, rest)
+            if method == "PUT" and kind == "contents":
+                return self._put_contents(req, rest, json.loads(body or b"{}"))
+            if method == "GET" and kind == "git" and rest.startswith("trees/"):
+                return self._get_tree(req)
+            return self._reply(req, method, kind, 404, {"message": "Not Found"})
+
+    def _get_contents(self, req, path):
+        data = self.files.get(path)
+        if data is None:
+            return self._reply(req, "GET", "contents", 404, {"message": "Not Found"})
+        sha = blob_sha(data)
+        etag = f'"{sha}"'
+        if req.headers.get("If-None-Match") == etag:
+            return self._reply(req, "GET", "contents", 304, None, {"ETag": etag})
+        return self._reply(req, "GET", "contents", 200, {
+            "path": path, "sha": sha, "encoding": "base64",
+            "content": base64.b64encode(data).decode("ascii"),
+        }, {"ETag": etag})
+
+    def _put_contents(self, req, path, payload):
+        current = self.files.get(path)
+        sha = payload.get("sha")
+        if current is not None and not sha:
+            return self._reply(req, "PUT", "contents", 422,
+                               {"message": 'Invalid request.\n\n"sha" wasn\'t supplied.'})
+        if current is not None and sha != blob_sha(current):
+            return self._reply(req, "PUT", "contents", 409, {"message": f"{path} does not match {sha}"})
+        if self.conflict_rate and self.random.random() < self.conflict_rate:
+            # As when another commit moved the branch head in between: retry from a fresh read
+            return self._reply(req, "PUT", "contents", 409, {"message": f"{path} does not match {sha}"})
+        data = base64.b64decode(payload.get("content", ""))
+        self.files[path] = data
+        return self._reply(req, "PUT", "contents", 201 if current is None else 200,
+                           {"content": {"path": path, "sha": blob_sha(data)}})
+
+    def _get_tree(self, req):
+        blobs = [(p, blob_sha(self.files[p])) for p in sorted(self.files)]
+        etag = '"%s"' % hashlib.sha1("\n".join(f"{p} {sha}" for p, sha in blobs).encode("utf-8")).hexdigest()
+        if req.headers.get("If-None-Match") == etag:
+            return self._reply(req, "GET", "trees", 304, None, {"ETag": etag})
+        return self._reply(req, "GET", "trees", 200,
+                           {"tree": [{"path": p, "type": "blob", "sha": sha} for p, sha in blobs],
+                            "truncated": False},
+                           {"ETag": etag})
+
+    def _reply(self, req, method, kind, status, payload, headers=None):
+        # Called with self._lock held
+        if status != 304 and status != 429:
+            self.remaining = max(0, self.remaining - 1)
+            self.min_remaining = min(self.min_remaining, self.remaining)
+        self.calls[f"{method} {kind} {status}"] += 1
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        req.send_response(status)
+        req.send_header("Content-Type", "application/json")
+        req.send_header("Content-Length", str(len(body)))
+        req.send_header("X-RateLimit-Limit", str(self.rate_limit))
+        req.send_header("X-RateLimit-Remaining", str(self.remaining))
+        req.send_header("X-RateLimit-Reset", str(self.reset_at))
+        for name, value in (headers or {}).items():
+            req.send_header(name, value)
+        req.end_headers()
+        if body:
+            req.wfile.write(body)
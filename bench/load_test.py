@@ -0,0 +1,215 @@
+"""
+Load test: N simulated students signing one attendance session, end to end
+through github_storage against a local fake GitHub (bench/fake_github.py).
+Runs offline.
+
+Each student follows the Student Recorder path: active-session lookup, the
+device check, the code check with is_code_valid, the dedupe pre-check, then
+the submission queue, polling the receipt until it resolves (as the page
+does). The rep's side (starting the session) goes through storage too.
+
+    python bench/load_test.py --students 300 --latency 0.15 --conflict-rate 0.05
+    python bench/load_test.py --json > bench_output.txt    # for comparisons
+
+Reported: submission latency p50/p95/p99 (click to confirmed), throughput,
+API calls per submission by kind, write-conflict rate, rate-limit headroom.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_github import FakeGitHub
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--students", type=int, default=200, help="simulated students")
+    p.add_argument("--concurrency", type=int, default=50, help="students on the page at once")
+    p.add_argument("--ramp", type=float, default=10.0, help="seconds over which students arrive")
+    p.add_argument("--dup-rate", type=float, default=0.05,
+                   help="share of students who submit twice (double taps / shared matric)")
+    p.add_argument("--latency", type=float, default=0.1, help="fake API latency, seconds")
+    p.add_argument("--jitter", type=float, default=0.05, help="extra random latency, seconds")
+    p.add_argument("--conflict-rate", type=float, default=0.0, help="share of PUTs answered 409")
+    p.add_argument("--secondary-rate", type=float, default=0.0,
+                   help="share of requests answered 429 + Retry-After")
+    p.add_argument("--rate-limit", type=int, default=5000, help="X-RateLimit-Limit of the fake")
+    p.add_argument("--window", type=float, default=None, help="submissions.FLUSH_WINDOW override")
+    p.add_argument("--workers", type=int, default=None, help="submissions.SUBMIT_WORKERS override")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    return p.parse_args(argv)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def start_session(storage, school, dept, level):
+    """What the rep page does on Start Attendance."""
+    from utils import date_str, time_str
+    d, t = date_str(), time_str()
+    sess = {
+        "school": school, "dept": dept, "level": level, "course_code": "BEN 101",
+        "started_at": time.time(), "date": d, "start_time": t,
+        "csv_path": storage.get_csv_path(school, dept, level, "BEN 101", d, t),
+    }
+    storage.start_session_files(sess)
+    _, sha = storage.get_active_session(school, dept, level)
+    storage.set_active_session(school, dept, level, sess, sha)
+    return sess
+
+
+def student(n, args, cohort, arrive_at, rng):
+    """One student's page visit. Returns (outcome, seconds from submit to resolved)."""
+    import storage
+    import submissions
+    from utils import get_current_code, is_code_valid, now_str
+
+    time.sleep(max(0.0, arrive_at - time.monotonic()))
+    school, dept, level = cohort
+    session = storage.get_active_session_cached(school, dept, level)
+    if session is None:
+        return "no_session", 0.0
+    csv_path = session["csv_path"]
+    device_id = f"bench-device-{n}"
+    if submissions.device_signed(csv_path, device_id):
+        return submissions.RESULT_DEVICE, 0.0
+
+    code, _, _ = get_current_code(session["started_at"])  # heard from the rep
+    if not is_code_valid(code, session["started_at"]):
+        return "bad_code", 0.0
+
+    matric = f"2021/BEN/{n:05d}"
+    entry = {"surname": f"STUDENT{n}", "first_name": "BENCH", "middle_name": "",
+             "matric": matric, "timestamp": now_str()}
+    start = time.monotonic()
+    result = submissions.precheck(csv_path, entry)
+    if result != submissions.RESULT_OK:
+        return result, time.monotonic() - start
+
+    queue = submissions.get_queue()
+    receipts = [queue.enqueue(csv_path, entry, device_id)]
+    if rng.random() < args.dup_rate:
+        receipts.append(queue.enqueue(csv_path, entry, device_id))
+    outcome = None
+    for receipt in receipts:
+        while True:
+            status, result = queue.status(receipt)
+            if status != submissions.STATUS_PENDING:
+                break
+            time.sleep(0.05)
+        outcome = outcome or (result if status == submissions.STATUS_CONFIRMED else status)
+    return outcome, time.monotonic() - start
+
+
+def run(args):
+    fake = FakeGitHub(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                      seed=args.seed).start()
+    os.environ.update({
+        "STORAGE_BACKEND": "github",
+        "GITHUB_API_URL": fake.url,
+        "GITHUB_TOKEN": "bench",
+        "GITHUB_REPO": "bench/futo-attendance-data",
+        "GITHUB_POOL_SIZE": str(max(16, args.concurrency)),
+    })
+    import storage
+    import submissions
+    from futo_data import get_schools, get_departments, get_levels
+
+    queue_kwargs = {}
+    if args.window is not None:
+        queue_kwargs["window"] = args.window
+    if args.workers is not None:
+        queue_kwargs["workers"] = args.workers
+    submissions.set_queue(submissions.CommitQueue(**queue_kwargs))
+
+    school = get_schools()[0]
+    dept = get_departments(school)[0]
+    level = get_levels(school, dept)[0]
+    sess = start_session(storage, school, dept, level)
+    setup_calls = fake.stats()["calls"]
+    # Injected failures apply to the students' traffic only, not the rep's setup
+    fake.conflict_rate, fake.secondary_rate = args.conflict_rate, args.secondary_rate
+
+    rng = random.Random(args.seed)
+    t0 = time.monotonic()
+    arrivals = sorted(t0 + rng.uniform(0, args.ramp) for _ in range(args.students))
+    rngs = [random.Random(rng.random()) for _ in range(args.students)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda n: student(n, args, (school, dept, level), arrivals[n], rngs[n]),
+                                range(args.students)))
+    wall = time.monotonic() - t0
+
+    stats = fake.stats()
+    calls = Counter(stats["calls"])
+    calls.subtract(setup_calls)
+    calls = {k: v for k, v in sorted(calls.items()) if v}
+    outcomes = Counter(r for r, _ in results)
+    latencies = [secs for r, secs in results if r == submissions.RESULT_OK]
+    confirmed = outcomes.get(submissions.RESULT_OK, 0)
+    puts = sum(v for k, v in calls.items() if k.startswith("PUT"))
+    conflicts = sum(v for k, v in calls.items() if k.startswith("PUT") and k.endswith(("409", "422")))
+    total_calls = sum(calls.values())
+    entries, _ = storage.read_entries(sess["csv_path"])
+    fake.stop()
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "students": args.students,
+        "outcomes": dict(outcomes),
+        "recorded_entries": len(entries),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_sec": round(confirmed / wall, 2) if wall else 0.0,
+        "latency_p50": round(percentile(latencies, 0.50), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "latency_p99": round(percentile(latencies, 0.99), 3),
+        "latency_max": round(max(latencies, default=0.0), 3),
+        "api_calls": calls,
+        "api_calls_total": total_calls,
+        "api_calls_per_submission": round(total_calls / confirmed, 3) if confirmed else None,
+        "write_conflict_rate": round(conflicts / puts, 4) if puts else 0.0,
+        "rate_limit_min_remaining": stats["rate_min_remaining"],
+        "queue": submissions.queue_stats(),
+        "write_stats": submissions.write_stats(sess["csv_path"]),
+    }
+
+
+def print_report(r):
+    print(f"students            {r['students']}  ({r['config']['concurrency']} at once over {r['config']['ramp']}s)")
+    print(f"outcomes            " + ", ".join(f"{k}={v}" for k, v in sorted(r["outcomes"].items())))
+    print(f"entries in the log  {r['recorded_entries']}")
+    print(f"wall time           {r['wall_seconds']}s   throughput {r['throughput_per_sec']} confirmed/s")
+    print(f"latency (s)         p50 {r['latency_p50']}  p95 {r['latency_p95']}  "
+          f"p99 {r['latency_p99']}  max {r['latency_max']}")
+    print(f"API calls           {r['api_calls_total']} total, {r['api_calls_per_submission']} per submission")
+    for kind, n in r["api_calls"].items():
+        print(f"  {kind:<22}{n}")
+    print(f"write conflicts     {r['write_conflict_rate']:.2%} of PUTs")
+    print(f"rate limit          {r['rate_limit_min_remaining']} of {r['config']['rate_limit']} left at lowest")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if report["recorded_entries"] != report["outcomes"].get("ok", 0):
+        sys.exit("log entries do not match confirmed submissions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 """Shared UI components for FUTO ULAS."""
+import time
+
 import streamlit as st
 import streamlit.components.v1 as components
 
+from utils import INTERVAL
+
 
 APP_NAME = "FUTO ULAS"
 APP_FULL = "FUTO ULAS — Unified Lecture Attendance System"
@@ -108,3 +112,109 @@ def live_code_display(code: str, secs_left: float):
         """,
         unsafe_allow_html=True,
     )
+
+
+# ─── Client-side code clock ───────────────────────────────────────────────────
+# utils.get_current_code seeds Python's random.Random (MT19937) per slot and
+# calls randint(0, 9999). The script below is the same generator in JS, so the
+# rep's browser can show each new code and the countdown without a rerun.
+
+_CODE_JS = """
+function mtSeed(seed) {
+    // random.Random(int): init_by_array over the seed's 32-bit words, low first
+    var key = [];
+    do { key.push(seed % 4294967296); seed = Math.floor(seed / 4294967296); } while (seed > 0);
+    var mt = new Array(624), i, j, k, s;
+    mt[0] = 19650218;
+    for (i = 1; i < 624; i++) {
+        s = mt[i - 1] ^ (mt[i - 1] >>> 30);
+        mt[i] = (Math.imul(s, 1812433253) + i) >>> 0;
+    }
+    i = 1; j = 0;
+    for (k = Math.max(624, key.length); k; k--) {
+        s = mt[i - 1] ^ (mt[i - 1] >>> 30);
+        mt[i] = ((mt[i] ^ Math.imul(s, 1664525)) >>> 0) + key[j] + j >>> 0;
+        i++; j++;
+        if (i >= 624) { mt[0] = mt[623]; i = 1; }
+        if (j >= key.length) j = 0;
+    }
+    for (k = 623; k; k--) {
+        s = mt[i - 1] ^ (mt[i - 1] >>> 30);
+        mt[i] = ((mt[i] ^ Math.imul(s, 1566083941)) >>> 0) - i >>> 0;
+        i++;
+        if (i >= 624) { mt[0] = mt[623]; i = 1; }
+    }
+    mt[0] = 0x80000000;
+    return {mt: mt, index: 624};
+}
+
+function mtNext(st) {
+    var mt = st.mt, y, kk;
+    if (st.index >= 624) {
+        for (kk = 0; kk < 624; kk++) {
+            y = (mt[kk] & 0x80000000) | (mt[(kk + 1) % 624] & 0x7fffffff);
+            mt[kk] = mt[(kk + 397) % 624] ^ (y >>> 1) ^ (y & 1 ? 0x9908b0df : 0);
+        }
+        st.index = 0;
+    }
+    y = mt[st.index++];
+    y ^= y >>> 11;
+    y ^= (y << 7) & 0x9d2c5680;
+    y ^= (y << 15) & 0xefc60000;
+    y ^= y >>> 18;
+    return y >>> 0;
+}
+
+function slotCode(startedAt, slot) {
+    // randint(0, 9999) = _randbelow(10000): 14-bit draws until one is < 10000
+    var st = mtSeed(Math.trunc(startedAt * 1000) + slot * 997), r;
+    do { r = mtNext(st) >>> 18; } while (r >= 10000);
+    return ("000" + r).slice(-4);
+}
+"""
+
+
+def live_code_clock(started_at: float, interval: int = INTERVAL):
+    """
+    The code and countdown tiles, driven in the browser. Codes come from the
+    same slot math as utils.get_current_code; the browser clock is corrected
+    by its offset from the server at render time.
+    """
+    components.html(
+        f"""
+        <div style="display:flex;gap:16px;font-family:sans-serif">
+          <div id="code-tile" style="flex:1;background:#1a1a2e;border-radius:16px;padding:24px;
+               text-align:center;border:2px solid #00ff88">
+            <p style="color:#aaa;margin:0;font-size:13px;letter-spacing:2px">CURRENT CODE</p>
+            <h1 id="code" style="color:#00ff88;font-size:72px;letter-spacing:12px;margin:8px 0;
+                font-family:monospace">----</h1>
+            <p style="color:#666;font-size:12px">Tell students this verbally — do NOT show them your screen</p>
+          </div>
+          <div style="flex:1;background:#1a1a2e;border-radius:16px;padding:24px;
+               text-align:center;border:2px solid #ffb800">
+            <p style="color:#aaa;margin:0;font-size:13px;letter-spacing:2px">REFRESHES IN</p>
+            <h1 id="secs" style="color:#ffb800;font-size:72px;margin:8px 0">--</h1>
+            <p style="color:#666;font-size:12px">Code changes every {interval} seconds — old codes stop working immediately</p>
+          </div>
+        </div>
+        <script>
+        {_CODE_JS}
+        var startedAt = {started_at!r}, interval = {interval};
+        var skew = {time.time()!r} * 1000 - Date.now();
+        var shown = -1;
+        function tick() {{
+            var elapsed = (Date.now() + skew) / 1000 - startedAt;
+            var slot = Math.floor(elapsed / interval);
+            if (slot !== shown) {{
+                document.getElementById("code").textContent = slotCode(startedAt, slot);
+                shown = slot;
+            }}
+            document.getElementById("secs").textContent =
+                Math.floor(interval - (elapsed % interval)) + "s";
+        }}
+        tick();
+        setInterval(tick, 250);
+        </script>
+        """,
+        height=220,
+    )
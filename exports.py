@@ -0,0 +1,25 @@
+"""Bulk exports of attendance records."""
+
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+
+EXPORT_WORKERS = 4  # concurrent downloads per export; keeps the API budget in check
+
+
+def build_zip(rows, workers=EXPORT_WORKERS):
+    """
+    Zips the CSVs of the given manifest rows (see storage.list_sessions).
+    Files are fetched by a bounded pool and written as they arrive, in order.
+    Returns the ZIP as bytes.
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        for row, content in zip(rows, pool.map(storage.read_session_csv, rows)):
+            if content:
+                zf.writestr(row["path"].rsplit("/", 1)[-1], content)
+    return buf.getvalue()
@@ -4,6 +4,9 @@ Source: https://legacy.futo.edu.ng/faculties-departments/
 SPGS and Directorate of General Studies excluded.
 """
 
+from types import MappingProxyType
+from typing import NamedTuple
+
 SCHOOL_DATA = {
     "School of Agriculture and Agricultural Technology (SAAT)": {
         "departments": [
@@ -121,21 +124,148 @@ SCHOOL_DATA = {
 }
 
 
+# ─── Cohort IDs ───────────────────────────────────────────────────────────────
+# Stable department numbers, keyed by (school abbreviation, department name).
+# A cohort ID is dept_id * 10 + level // 100 (e.g. 4033 = SEET Chemical
+# Engineering 300L). When a name changes, change its key here and keep the
+# number; new departments take the next unused number in their school.
+
+DEPT_IDS = {
+    ("SAAT", "Agribusiness"):                                101,
+    ("SAAT", "Agricultural Economics"):                      102,
+    ("SAAT", "Agricultural Extension"):                      103,
+    ("SAAT", "Animal Science and Technology"):               104,
+    ("SAAT", "Crop Science and Technology"):                 105,
+    ("SAAT", "Fisheries and Aquaculture Technology"):        106,
+    ("SAAT", "Forestry and Wildlife Technology"):            107,
+    ("SAAT", "Soil Science and Technology"):                 108,
+    ("SBMS", "Human Anatomy"):                               201,
+    ("SBMS", "Human Physiology"):                            202,
+    ("SOBS", "Biochemistry"):                                301,
+    ("SOBS", "Biology"):                                     302,
+    ("SOBS", "Biotechnology"):                               303,
+    ("SOBS", "Forensic Science"):                            304,
+    ("SOBS", "Microbiology"):                                305,
+    ("SEET", "Agricultural and Bio Resources Engineering"):  401,
+    ("SEET", "Biomedical Engineering"):                      402,
+    ("SEET", "Chemical Engineering"):                        403,
+    ("SEET", "Civil Engineering"):                           404,
+    ("SEET", "Food Science and Technology"):                 405,
+    ("SEET", "Material and Metallurgical Engineering"):      406,
+    ("SEET", "Mechanical Engineering"):                      407,
+    ("SEET", "Petroleum Engineering"):                       408,
+    ("SEET", "Polymer and Textile Engineering"):             409,
+    ("SESET", "Computer Engineering"):                       501,
+    ("SESET", "Electrical (Power Systems) Engineering"):     502,
+    ("SESET", "Electronics Engineering"):                    503,
+    ("SESET", "Mechatronics Engineering"):                   504,
+    ("SESET", "Telecommunications Engineering"):             505,
+    ("SOES", "Architecture"):                                601,
+    ("SOES", "Building Technology"):                         602,
+    ("SOES", "Environmental Management"):                    603,
+    ("SOES", "Environmental Management and Evaluation"):     604,
+    ("SOES", "Quantity Surveying"):                          605,
+    ("SOES", "Surveying and Geoinformatics"):                606,
+    ("SOES", "Urban and Regional Planning"):                 607,
+    ("SOHT", "Dental Technology"):                           701,
+    ("SOHT", "Environmental Health Science"):                702,
+    ("SOHT", "Optometry"):                                   703,
+    ("SOHT", "Prosthetics and Orthotics"):                   704,
+    ("SOHT", "Public Health Technology"):                    705,
+    ("SICT", "Computer Science"):                            801,
+    ("SICT", "Cyber Security"):                              802,
+    ("SICT", "Information Technology"):                      803,
+    ("SICT", "Software Engineering"):                        804,
+    ("SLIT", "Entrepreneurship and Innovation"):             901,
+    ("SLIT", "Logistics and Transport Technology"):          902,
+    ("SLIT", "Maritime Technology and Logistics"):           903,
+    ("SLIT", "Project Management Technology"):               904,
+    ("SLIT", "Supply Chain Management"):                     905,
+    ("SOPS", "Chemistry"):                                   1001,
+    ("SOPS", "Geology"):                                     1002,
+    ("SOPS", "Mathematics"):                                 1003,
+    ("SOPS", "Physics"):                                     1004,
+    ("SOPS", "Science Laboratory Technology"):               1005,
+    ("SOPS", "Statistics"):                                  1006,
+}
+
+ATTENDANCES_ROOT = "attendances"
+
+
+def safe_name(s):
+    for ch in ["/", " ", "(", ")", ","]:
+        s = s.replace(ch, "_")
+    return s
+
+
+def school_abbr(school):
+    return school.rsplit("(", 1)[-1].rstrip(")") if school.endswith(")") else school
+
+
+class Cohort(NamedTuple):
+    id: int
+    school: str
+    dept: str
+    level: str
+    key: str           # storage key, "School||Dept||Level"
+    dir: str           # attendance folder under the data repo
+    password_key: str  # rep_passwords.json key, "School|Dept|Level"
+
+
+# ─── Catalog ──────────────────────────────────────────────────────────────────
+# Compiled once at import; the lookups below never touch SCHOOL_DATA again.
+
+def _compile():
+    schools, depts, levels, cohorts, by_name = [], {}, {}, {}, {}
+    for school in sorted(SCHOOL_DATA):
+        data = SCHOOL_DATA[school]
+        overrides = data.get("levels_override", {})
+        schools.append(school)
+        depts[school] = tuple(data["departments"])
+        levels[(school, None)] = tuple(data.get("levels", ["100", "200", "300", "400"]))
+        for dept in data["departments"]:
+            dept_levels = tuple(overrides.get(dept, levels[(school, None)]))
+            levels[(school, dept)] = dept_levels
+            dept_id = DEPT_IDS[(school_abbr(school), dept)]
+            for level in dept_levels:
+                c = Cohort(
+                    id=dept_id * 10 + int(level) // 100,
+                    school=school, dept=dept, level=level,
+                    key=f"{school}||{dept}||{level}",
+                    dir=f"{ATTENDANCES_ROOT}/{safe_name(school)}/{safe_name(dept)}/{level}L",
+                    password_key=f"{school}|{dept}|{level}",
+                )
+                cohorts[c.id] = c
+                by_name[(school, dept, level)] = c
+    return (tuple(schools), MappingProxyType(depts), MappingProxyType(levels),
+            MappingProxyType(cohorts), MappingProxyType(by_name))
+
+
+SCHOOLS, DEPARTMENTS, LEVELS, COHORTS, _COHORTS_BY_NAME = _compile()
+
+
 def get_schools():
-    return sorted(SCHOOL_DATA.keys())
+    return list(SCHOOLS)
 
 
 def get_departments(school):
-    if school in SCHOOL_DATA:
-        return SCHOOL_DATA[school]["departments"]
-    return []
+    return list(DEPARTMENTS.get(school, ()))
 
 
 def get_levels(school, department):
-    if school not in SCHOOL_DATA:
-        return []
-    data = SCHOOL_DATA[school]
-    overrides = data.get("levels_override", {})
-    if department in overrides:
-        return overrides[department]
-    return data.get("levels", ["100", "200", "300", "400"])
+    """A department's levels; the school's default levels for a department not listed."""
+    return list(LEVELS.get((school, department), LEVELS.get((school, None), ())))
+
+
+def cohort_for(school, dept, level):
+    """The Cohort for these names, or None if they are not in the catalog."""
+    return _COHORTS_BY_NAME.get((school, dept, str(level)))
+
+
+def get_cohort(cohort_id):
+    return COHORTS.get(int(cohort_id))
+
+
+def cohort_label(cohort):
+    """Short display name, e.g. "SICT · Computer Science · 300L"."""
+    return f"{school_abbr(cohort.school)} · {cohort.dept} · {cohort.level}L"
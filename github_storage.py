@@ -3,70 +3,403 @@ GitHub Storage Backend for FUTO ULAS.
 
 All attendance data lives in a SEPARATE GitHub data repo.
 This prevents Streamlit Cloud from reloading the app on data changes.
+Pages reach it through storage.GitHubBackend (see storage.py).
 
 Streamlit secrets.toml:
   GITHUB_TOKEN  = "ghp_xxxxx"
   GITHUB_REPO   = "yourusername/futo-attendance-data"
   GITHUB_BRANCH = "main"
+
+Optional tuning (same place, or env vars):
+  GITHUB_READ_TIMEOUT  = 10    # seconds
+  GITHUB_WRITE_TIMEOUT = 20
+  GITHUB_MAX_RETRIES   = 3     # on secondary rate limits, and 5xx on GETs
+  GITHUB_POOL_SIZE     = 16    # keep-alive connections
+  GITHUB_API_URL       = "https://api.github.com"  # e.g. bench/fake_github.py
+  GITHUB_BUDGET_LOW      = 0.30  # share of the hourly budget left: back off polling
+  GITHUB_BUDGET_CRITICAL = 0.10  # ...and lengthen cache TTLs
+  GITHUB_BUDGET_RESERVE  = 0.02  # ...and all but stop background polling; submissions go on
 """
 
-import os
 import json
+import time
 import base64
+import random
+import threading
+from collections import OrderedDict
 import requests
-import streamlit as st
+from requests.adapters import HTTPAdapter
+
+import metrics
+import profiler
+from settings import setting
+
+
+class ShaConflict(Exception):
+    """A write carried a stale (or missing) sha: someone else wrote first."""
 
 
 def _get_config():
-    try:
-        token  = st.secrets["GITHUB_TOKEN"]
-        repo   = st.secrets["GITHUB_REPO"]
-        branch = st.secrets.get("GITHUB_BRANCH", "main")
-    except Exception:
-        token  = os.environ.get("GITHUB_TOKEN", "")
-        repo   = os.environ.get("GITHUB_REPO", "")
-        branch = os.environ.get("GITHUB_BRANCH", "main")
-    return token, repo, branch
-
-
-def _headers():
-    token, _, _ = _get_config()
     return {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json",
-        "Content-Type": "application/json",
+        "token":         setting("GITHUB_TOKEN", ""),
+        "repo":          setting("GITHUB_REPO", ""),
+        "branch":        setting("GITHUB_BRANCH", "main"),
+        "read_timeout":  float(setting("GITHUB_READ_TIMEOUT", 10)),
+        "write_timeout": float(setting("GITHUB_WRITE_TIMEOUT", 20)),
+        "max_retries":   int(setting("GITHUB_MAX_RETRIES", 3)),
+        "pool_size":     int(setting("GITHUB_POOL_SIZE", 16)),
+        "api_url":       setting("GITHUB_API_URL", "https://api.github.com"),
     }
 
 
-def _api_url(path):
-    _, repo, _ = _get_config()
-    return f"https://api.github.com/repos/{repo}/contents/{path}"
-
+# ─── Rate-limit budget ────────────────────────────────────────────────────────
+# Every student and rep shares one token (5000 requests an hour). Each response
+# carries X-RateLimit-Remaining/-Reset; secondary limits send Retry-After. As
+# the budget runs down, callers degrade in order: background polling backs off
+# first, then cached values are kept longer; submissions are never throttled.
+
+BUDGET_OK        = "ok"
+BUDGET_LOW       = "low"        # poll_factor() > 1
+BUDGET_CRITICAL  = "critical"   # ttl_factor() > 1 as well
+BUDGET_RESERVE   = "reserve"    # background polling all but stopped
+
+POLL_FACTORS = {BUDGET_OK: 1, BUDGET_LOW: 3, BUDGET_CRITICAL: 6, BUDGET_RESERVE: 20}
+TTL_FACTORS  = {BUDGET_OK: 1, BUDGET_LOW: 1, BUDGET_CRITICAL: 6, BUDGET_RESERVE: 12}
+
+
+class RateBudget:
+    """The token's remaining budget as last reported by GitHub."""
+
+    def __init__(self, low=0.30, critical=0.10, reserve=0.02):
+        self.low, self.critical, self.reserve = low, critical, reserve
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None        # epoch seconds
+        self.retry_until = 0.0      # epoch seconds; from the last Retry-After
+        self.observed_at = None
+        self._lock = threading.Lock()
+
+    def observe(self, resp):
+        h = resp.headers
+        now = time.time()
+        with self._lock:
+            try:
+                if "X-RateLimit-Remaining" in h:
+                    self.remaining = int(h["X-RateLimit-Remaining"])
+                    self.limit = int(h.get("X-RateLimit-Limit", self.limit or 5000))
+                    self.reset_at = float(h.get("X-RateLimit-Reset", now + 3600))
+                    self.observed_at = now
+                if "Retry-After" in h:
+                    self.retry_until = max(self.retry_until, now + float(h["Retry-After"]))
+            except ValueError:
+                pass
+
+    def fraction(self):
+        """Share of the budget left; 1.0 when unknown or past the reset time."""
+        with self._lock:
+            if self.remaining is None or not self.limit or time.time() >= (self.reset_at or 0):
+                return 1.0
+            return self.remaining / self.limit
+
+    def stage(self):
+        left = self.fraction()
+        if left <= self.reserve:
+            return BUDGET_RESERVE
+        if left <= self.critical:
+            return BUDGET_CRITICAL
+        if left <= self.low or time.time() < self.retry_until:
+            return BUDGET_LOW
+        return BUDGET_OK
+
+    def poll_factor(self):
+        """How many times longer background polling should wait."""
+        return POLL_FACTORS[self.stage()]
+
+    def ttl_factor(self):
+        """How many times longer cached values may be kept."""
+        return TTL_FACTORS[self.stage()]
+
+    def snapshot(self):
+        stage = self.stage()
+        with self._lock:
+            return {
+                "limit": self.limit, "remaining": self.remaining, "reset_at": self.reset_at,
+                "reset_in": max(0.0, self.reset_at - time.time()) if self.reset_at else None,
+                "retry_after_in": max(0.0, self.retry_until - time.time()),
+                "observed_at": self.observed_at, "stage": stage,
+                "poll_factor": POLL_FACTORS[stage], "ttl_factor": TTL_FACTORS[stage],
+            }
+
+
+budget = RateBudget(
+    low=float(setting("GITHUB_BUDGET_LOW", 0.30)),
+    critical=float(setting("GITHUB_BUDGET_CRITICAL", 0.10)),
+    reserve=float(setting("GITHUB_BUDGET_RESERVE", 0.02)),
+)
+
+
+def rate_budget():
+    """The current budget: limit, remaining, reset_in, stage and the two factors."""
+    return budget.snapshot()
+
+
+# ─── Client ───────────────────────────────────────────────────────────────────
+
+RETRY_STATUSES = (500, 502, 503, 504)
+BACKOFF_BASE = 0.5   # seconds; doubled per attempt, with full jitter
+BACKOFF_MAX  = 8.0   # never sleep longer than this on a user-facing call
+
+
+def _is_secondary_limit(resp):
+    if resp.status_code not in (403, 429):
+        return False
+    return "Retry-After" in resp.headers or "secondary rate limit" in resp.text.lower()
+
+
+class GitHubClient:
+    """
+    One long-lived keep-alive session for the data repo. Config is resolved
+    once; secondary rate-limit responses, and 5xx responses to GETs, are
+    retried with jittered exponential backoff (honouring Retry-After when
+    GitHub sends one). A PUT that got a 5xx may still have landed, so it is
+    returned as is for the caller to re-read.
+    """
+
+    def __init__(self, token, repo, branch="main", read_timeout=10, write_timeout=20,
+                 max_retries=3, pool_size=16, api_url="https://api.github.com"):
+        self.repo = repo
+        self.branch = branch
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.max_retries = max_retries
+        self.api_url = f"{api_url.rstrip('/')}/repos/{repo}"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+            "Content-Type": "application/json",
+        })
+
+    def contents_url(self, path):
+        return f"{self.api_url}/contents/{path}"
+
+    def tree_url(self):
+        return f"{self.api_url}/git/trees/{self.branch}"
+
+    def _delay(self, attempt, resp):
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method, url, timeout, **kwargs):
+        attempt = 0
+        while True:
+            resp = None
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+                budget.observe(resp)
+                retry = ((method == "GET" and resp.status_code in RETRY_STATUSES)
+                         or _is_secondary_limit(resp))
+            except requests.ConnectionError:
+                # Timeouts are not retried: a PUT may already have landed.
+                if attempt >= self.max_retries:
+                    raise
+                retry = True
+            if not retry or attempt >= self.max_retries:
+                return resp
+            delay = self._delay(attempt, resp)
+            if delay > BACKOFF_MAX:
+                return resp
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, headers=None, params=None):
+        return self.request("GET", url, self.read_timeout, headers=headers, params=params)
+
+    def put(self, url, payload):
+        return self.request("PUT", url, self.write_timeout, json=payload)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GitHubClient(**_get_config())
+    return _client
+
+
+# ─── Read cache ───────────────────────────────────────────────────────────────
+# GitHub answers a GET carrying a matching If-None-Match with 304 Not Modified:
+# no payload, and it does not count against the rate limit. We keep the last
+# ETag and decoded content per path so unchanged files cost almost nothing.
+
+CACHE_MAX_ENTRIES = 256
+
+
+class ReadCache:
+    """Bounded LRU of path -> (etag, content, sha) with hit/miss counters."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, etag, content, sha):
+        if not etag:
+            return
+        with self._lock:
+            self._items[key] = (etag, content, sha)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def drop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_cache = ReadCache()
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+# ─── Metrics ──────────────────────────────────────────────────────────────────
+
+OP_SECONDS = metrics.histogram("github_op_seconds", "GitHub API operations, retries included",
+                               ("op", "path_class"))
+OP_TOTAL   = metrics.counter("github_ops_total", "GitHub API operations by final status",
+                             ("op", "path_class", "status"))
+OP_BYTES   = metrics.counter("github_bytes_total", "File content moved (decoded bytes)",
+                             ("op", "path_class"))
+CACHE_TOTAL     = metrics.counter("github_cache_total", "Conditional GETs: hit = 304 from the ETag cache",
+                                  ("result",))
+CONFLICTS_TOTAL = metrics.counter("github_conflicts_total", "Writes rejected for a stale or missing sha",
+                                  ("path_class",))
+
+PATH_CLASSES = (
+    ("_log.jsonl", "log"), ("_active.json", "active"), ("_manifest.json", "manifest"),
+    ("_devices.json", "devices"), (".csv", "csv"), ("active_attendances.json", "active_index"),
+    ("rep_passwords.json", "passwords"),
+)
+
 
+def path_class(path):
+    """Coarse kind of a data-repo path, for metric labels."""
+    for suffix, kind in PATH_CLASSES:
+        if path.endswith(suffix):
+            return kind
+    return "other"
+
+
+def _record_op(op, kind, start, status, nbytes=0):
+    OP_SECONDS.observe(time.perf_counter() - start, op=op, path_class=kind)
+    OP_TOTAL.inc(op=op, path_class=kind, status=status)
+    if nbytes:
+        OP_BYTES.inc(nbytes, op=op, path_class=kind)
+
+
+def _conditional_get(key, url, params):
+    """GET with If-None-Match. Returns (response, cached_item_or_None)."""
+    cached = _cache.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else None
+    resp = get_client().get(url, headers=headers, params=params)
+    if resp.status_code == 304 and cached:
+        _cache.record(hit=True)
+        CACHE_TOTAL.inc(result="hit")
+        return resp, cached
+    _cache.record(hit=False)
+    CACHE_TOTAL.inc(result="miss")
+    return resp, None
+
+
+@profiler.traced("github.read_file", arg="path")
 def read_file(path):
     """Returns (content_str, sha) or (None, None)."""
-    _, _, branch = _get_config()
-    resp = requests.get(_api_url(path), headers=_headers(), params={"ref": branch}, timeout=15)
+    client = get_client()
+    start, kind = time.perf_counter(), path_class(path)
+    resp, cached = _conditional_get(path, client.contents_url(path), {"ref": client.branch})
+    if cached:
+        _record_op("read", kind, start, 304)
+        return cached[1], cached[2]
     if resp.status_code == 404:
+        _record_op("read", kind, start, 404)
+        _cache.drop(path)
         return None, None
+    if resp.status_code != 200:
+        _record_op("read", kind, start, resp.status_code)
     resp.raise_for_status()
     data = resp.json()
-    return base64.b64decode(data["content"]).decode("utf-8"), data["sha"]
+    raw = base64.b64decode(data["content"])
+    content = raw.decode("utf-8")
+    _cache.put(path, resp.headers.get("ETag"), content, data["sha"])
+    _record_op("read", kind, start, 200, len(raw))
+    return content, data["sha"]
 
 
+@profiler.traced("github.write_file", arg="path")
 def write_file(path, content_str, message, sha=None):
-    _, _, branch = _get_config()
+    """Returns the new blob sha."""
+    client = get_client()
+    start, kind = time.perf_counter(), path_class(path)
+    raw = content_str.encode("utf-8")
     payload = {
         "message": message,
-        "content": base64.b64encode(content_str.encode("utf-8")).decode("utf-8"),
-        "branch": branch,
+        "content": base64.b64encode(raw).decode("utf-8"),
+        "branch": client.branch,
     }
     if sha:
         payload["sha"] = sha
-    resp = requests.put(_api_url(path), headers=_headers(), json=payload, timeout=20)
+    resp = client.put(client.contents_url(path), payload)
+    _cache.drop(path)
+    _record_op("write", kind, start, resp.status_code, len(raw) if resp.status_code in (200, 201) else 0)
     if resp.status_code in (200, 201):
-        return True
-    raise Exception(f"GitHub write error {resp.status_code}: {resp.text[:400]}")
+        return resp.json()["content"]["sha"]
+    if resp.status_code == 409 or (resp.status_code == 422 and "sha" in resp.text):
+        CONFLICTS_TOTAL.inc(path_class=kind)
+        raise ShaConflict(f"GitHub write conflict {resp.status_code}: {resp.text[:400]}")
+    if resp.status_code in RETRY_STATUSES:
+        # Not retried by the client: the write may have landed. Callers re-read and try again.
+        raise ShaConflict(f"GitHub write error {resp.status_code}, outcome unknown: {resp.text[:400]}")
+    raise requests.HTTPError(f"GitHub write error {resp.status_code}: {resp.text[:400]}", response=resp)
 
 
 def read_json(path):
@@ -81,63 +414,22 @@ def write_json(path, data, message, sha=None):
 
 
 def list_files_in_dir(path_prefix):
-    _, repo, branch = _get_config()
-    url = f"https://api.github.com/repos/{repo}/git/trees/{branch}"
-    resp = requests.get(url, headers=_headers(), params={"recursive": "1"}, timeout=20)
-    if resp.status_code != 200:
-        return []
-    return [item["path"] for item in resp.json().get("tree", [])
-            if item["path"].startswith(path_prefix) and item["type"] == "blob"]
-
-
-# ─── Attendance helpers ───────────────────────────────────────────────────────
-
-ACTIVE_PATH    = "active_attendances.json"
-PASSWORDS_PATH = "rep_passwords.json"
-ATTENDANCES_ROOT = "attendances"
-
-
-def _safe(s):
-    for ch in ["/", " ", "(", ")", ","]:
-        s = s.replace(ch, "_")
-    return s
-
-
-def att_dir(school, dept, level):
-    return f"{ATTENDANCES_ROOT}/{_safe(school)}/{_safe(dept)}/{level}L"
-
-
-def att_key(school, dept, level):
-    return f"{school}||{dept}||{level}"
-
-
-def get_active_attendances():
-    data, sha = read_json(ACTIVE_PATH)
-    return (data or {}), sha
-
-
-def set_active_attendances(data, sha=None):
-    return write_json(ACTIVE_PATH, data, "Update active attendances", sha)
-
-
-def get_csv_path(school, dept, level, course_code, date_str, time_str):
-    safe_code = course_code.replace(" ", "_")
-    return f"{att_dir(school, dept, level)}/{safe_code}_{date_str}_{time_str}.csv"
-
-
-def get_devices_path(csv_path):
-    return csv_path.replace(".csv", "_devices.json")
-
-
-def list_attendance_csvs(school, dept, level):
-    prefix = att_dir(school, dept, level)
-    return sorted([f for f in list_files_in_dir(prefix) if f.endswith(".csv")], reverse=True)
-
-
-def get_custom_passwords():
-    data, sha = read_json(PASSWORDS_PATH)
-    return (data or {}), sha
-
-
-def set_custom_passwords(data, sha=None):
-    return write_json(PASSWORDS_PATH, data, "Update rep passwords", sha)
+    return list(list_blobs(path_prefix))
+
+
+@profiler.traced("github.list_blobs", arg="path")
+def list_blobs(path_prefix):
+    """{path: blob sha} for every file under the prefix, from one (cached) tree listing."""
+    client = get_client()
+    key = f"tree:{client.branch}"
+    start = time.perf_counter()
+    resp, cached = _conditional_get(key, client.tree_url(), {"recursive": "1"})
+    _record_op("list", "tree", start, resp.status_code)
+    if cached:
+        tree = cached[1]
+    elif resp.status_code != 200:
+        return {}
+    else:
+        tree = [(item["path"], item["type"], item.get("sha")) for item in resp.json().get("tree", [])]
+        _cache.put(key, resp.headers.get("ETag"), tree, None)
+    return {path: sha for path, kind, sha in tree if path.startswith(path_prefix) and kind == "blob"}
@@ -0,0 +1,215 @@
+"""
+In-process metrics for FUTO ULAS.
+
+Counters, gauges and latency histograms, each keyed by label values, held in
+one registry per process (shared by every Streamlit session). They can be
+rendered in the Prometheus text format, written to a file, or read as rows
+for the Admin page.
+
+    REQUESTS = metrics.counter("github_requests_total", "GitHub API calls", ("op", "status"))
+    REQUESTS.inc(op="read", status=200)
+    with metrics.histogram("page_run_seconds", "Page script runs", ("page",)).time(page="student"):
+        ...
+
+Optional setting (secrets.toml or env var):
+  METRICS_FILE = "/tmp/futo_metrics.prom"   # where dump() writes by default
+"""
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from settings import setting
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS    = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _fmt_num(x):
+    if x == float("inf"):
+        return "+Inf"
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+# ─── Metric types ─────────────────────────────────────────────────────────────
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """[(labels_key, value)]"""
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_num(v)}" for k, v in self.samples()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(self.labelnames, labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        """[(labels_key, count, sum, per-bucket counts)]"""
+        with self._lock:
+            return sorted((k, sum(row[:-1]), row[-1], list(row[:-1])) for k, row in self._values.items())
+
+    def quantile(self, q, counts):
+        """Upper bound of the bucket holding quantile q (inf past the last bucket)."""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= q * total:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = []
+        for key, count, total, counts in self.samples():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = ("le", _fmt_num(float(bound)) if bound != float("inf") else "+Inf")
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_num(float(total))}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# ─── Registry ─────────────────────────────────────────────────────────────────
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered as a different type or labels")
+            return metric
+
+    def metrics(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for m in self.metrics():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY._get(Counter, name, help, labelnames)
+
+
+def gauge(name, help, labelnames=()):
+    return REGISTRY._get(Gauge, name, help, labelnames)
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY._get(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def dump(path=None):
+    """Writes render() to `path` (default METRICS_FILE) via a temp file; returns the path or None."""
+    path = path or setting("METRICS_FILE", "")
+    if not path:
+        return None
+    tmp = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+    return path
+
+
+def rows():
+    """One dict per labelled series, for tables: histograms get count, mean, p50, p95."""
+    out = []
+    for m in REGISTRY.metrics():
+        if isinstance(m, Histogram):
+            for key, count, total, counts in m.samples():
+                out.append({"metric": m.name, "labels": dict(zip(m.labelnames, key)), "count": count,
+                            "mean": total / count if count else 0.0,
+                            "p50": m.quantile(0.50, counts), "p95": m.quantile(0.95, counts)})
+        else:
+            for key, value in m.samples():
+                out.append({"metric": m.name, "labels": dict(zip(m.labelnames, key)), "value": value})
+    return out
@@ -1,4 +1,5 @@
 import time
+from datetime import date
 import streamlit as st
 import pandas as pd
 
@@ -7,22 +8,35 @@ st.set_page_config(page_title="Course Rep — FUTO Attendance", page_icon="📌"
 import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from futo_data import get_schools, get_departments, get_levels
-from utils import (verify_rep_login, get_current_code, entries_to_csv,
-                   csv_to_entries, is_dup_name, is_dup_matric, now_str, date_str, time_str)
-import github_storage as gs
+from futo_data import (get_schools, get_departments, get_levels, cohort_for,
+                       get_cohort, cohort_label, COHORTS)
+from utils import (verify_rep_login, entries_to_csv,
+                   DedupeIndex, now_str, date_str, time_str)
+from components import live_code_clock
+import metrics
+import profiler
+import storage
+import submissions
+import exports
+import analytics
+
+
+PAGE_RUNS = metrics.histogram("page_run_seconds", "Streamlit script runs", ("page",))
 
 
 # ─── Session state ────────────────────────────────────────────────────────────
 for k, v in {
     "rep_logged_in": False, "rep_school": None, "rep_dept": None, "rep_level": None,
     "active_session": None, "current_entries": [], "csv_path": None, "confirm_end": False,
+    "dedupe": DedupeIndex(), "downloads": {}, "zip_export": None, "feed": None,
+    "analytics": None,
 }.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
 
 # ─── Login ────────────────────────────────────────────────────────────────────
+@profiler.traced()
 def show_login():
     st.title("📌 Course Rep Login")
     st.caption("FUTO Attendance System")
@@ -47,7 +61,8 @@ def show_login():
     password = st.text_input("Password", type="password")
 
     if st.button("Login →", type="primary"):
-        if verify_rep_login(school, dept, level_num, password):
+        custom_hashes, _ = storage.get_custom_passwords()
+        if verify_rep_login(cohort_for(school, dept, level_num), password, custom_hashes):
             st.session_state.rep_logged_in = True
             st.session_state.rep_school = school
             st.session_state.rep_dept = dept
@@ -58,32 +73,52 @@ def show_login():
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
+@profiler.traced()
 def reload_session():
     school = st.session_state.rep_school
     dept = st.session_state.rep_dept
     level = st.session_state.rep_level
-    key = gs.att_key(school, dept, level)
-    active_all, _ = gs.get_active_attendances()
-    if key in active_all:
-        sess = active_all[key]
+    sess, _ = storage.get_active_session(school, dept, level)
+    if sess is not None:
         st.session_state.active_session = sess
         csv_path = sess.get("csv_path", "")
         st.session_state.csv_path = csv_path
-        content, _ = gs.read_file(csv_path)
-        st.session_state.current_entries = csv_to_entries(content) if content else []
+        feed = st.session_state.feed
+        if feed is None or feed.csv_path != csv_path:
+            feed = st.session_state.feed = storage.EntryFeed(csv_path)
+        feed.poll(min_gap=storage.poll_gap())  # only what was appended since the last poll
+        st.session_state.current_entries = feed.entries
+        st.session_state.dedupe = submissions.session_index(csv_path, feed.entries)
     else:
         st.session_state.active_session = None
         st.session_state.current_entries = []
+        st.session_state.dedupe = DedupeIndex()
+
+
+def add_entry(entry):
+    """Returns a submissions.RESULT_* value (duplicates are re-checked against the latest log)."""
+    result = submissions.add_entry(st.session_state.csv_path, entry)
+    if st.session_state.feed is not None:
+        st.session_state.feed.polled_at = None  # show it on the next rerun even while polling backs off
+    return result
+
 
+def update_entry(old, new):
+    """Edits (or deletes, when new is None) an entry. Returns a submissions.RESULT_* value."""
+    st.session_state.feed = None  # the log is rewritten; read it afresh on the next rerun
+    return submissions.update_entry(st.session_state.csv_path, old, new)
 
-def save_entries(entries):
-    csv_str = entries_to_csv(entries)
-    _, sha = gs.read_file(st.session_state.csv_path)
-    gs.write_file(st.session_state.csv_path, csv_str, "Update attendance entries", sha)
-    st.session_state.current_entries = entries
+
+RESULT_ERRORS = {
+    submissions.RESULT_DUP_NAME:   "A student with that name is already in this attendance.",
+    submissions.RESULT_DUP_MATRIC: "That matric number is already in this attendance.",
+    submissions.RESULT_MISSING:    "That entry was changed by someone else — pick it again.",
+    submissions.RESULT_CLOSED:     "This attendance has already ended.",
+}
 
 
 # ─── Dashboard ────────────────────────────────────────────────────────────────
+@profiler.traced()
 def show_dashboard():
     school = st.session_state.rep_school
     dept = st.session_state.rep_dept
@@ -98,14 +133,16 @@ def show_dashboard():
         st.write("")
         if st.button("Logout"):
             for k in ["rep_logged_in","rep_school","rep_dept","rep_level",
-                      "active_session","current_entries","csv_path","confirm_end"]:
+                      "active_session","current_entries","csv_path","confirm_end","feed",
+                      "analytics"]:
                 st.session_state[k] = False if k == "rep_logged_in" else ([] if k == "current_entries" else None)
             st.rerun()
 
     st.divider()
     reload_session()
 
-    tab_att, tab_edit, tab_download = st.tabs(["📋 Attendance", "✏️ Edit Entries", "📥 Download Records"])
+    tab_att, tab_edit, tab_download, tab_stats = st.tabs(
+        ["📋 Attendance", "✏️ Edit Entries", "📥 Download Records", "📊 Analytics"])
 
     with tab_att:
         show_attendance_tab(school, dept, level)
@@ -113,38 +150,53 @@ def show_dashboard():
         show_edit_tab()
     with tab_download:
         show_download_tab(school, dept, level)
+    with tab_stats:
+        show_analytics_tab(school, dept, level)
 
 
 # ─── Attendance Tab ───────────────────────────────────────────────────────────
+@profiler.traced()
 def show_attendance_tab(school, dept, level):
     active = st.session_state.active_session
 
+    cohort = cohort_for(school, dept, level)
+
     if active is None:
         st.subheader("Start Attendance")
         course_code = st.text_input("Course Code", placeholder="e.g. CHE 401").strip().upper()
+        guests = []
+        if cohort is not None:
+            with st.expander("👥 Shared lecture (general course)"):
+                st.caption("Open one session for every department and level taking this lecture: "
+                           "one code for all, and each cohort still gets its own CSV when it ends.")
+                guests = st.multiselect(
+                    "Also open for", [c.id for c in sorted(COHORTS.values(), key=cohort_label) if c != cohort],
+                    format_func=lambda cid: cohort_label(get_cohort(cid)))
         if st.button("▶ Start Attendance", type="primary"):
             if not course_code:
                 st.error("Enter a course code first.")
                 return
-            active_all, sha = gs.get_active_attendances()
-            own_key = gs.att_key(school, dept, level)
-            if own_key in active_all:
-                st.error("You already have an active attendance.")
-                return
             d, t = date_str(), time_str()
-            csv_path = gs.get_csv_path(school, dept, level, course_code, d, t)
-            gs.write_file(csv_path, entries_to_csv([]), "Start attendance", None)
+            csv_path = storage.get_csv_path(school, dept, level, course_code, d, t)
             sess = {
+                "cohort": cohort.id if cohort else None,
                 "school": school, "dept": dept, "level": level,
                 "course_code": course_code, "started_at": time.time(),
                 "date": d, "start_time": t, "csv_path": csv_path,
             }
-            active_all[own_key] = sess
-            gs.set_active_attendances(active_all, sha)
+            busy = storage.start_session(sess, [get_cohort(cid) for cid in guests])
+            if (school, dept, level) in busy:
+                st.error("You already have an active attendance.")
+                return
+            if busy:
+                st.error("Attendance is already running for " +
+                         ", ".join(cohort_label(cohort_for(*names)) for names in busy) + ".")
+                return
             st.session_state.active_session = sess
             st.session_state.current_entries = []
             st.session_state.csv_path = csv_path
-            st.success(f"✅ Attendance started for **{course_code}**")
+            st.success(f"✅ Attendance started for **{course_code}**"
+                       + (f" ({len(guests) + 1} cohorts)" if guests else ""))
             st.rerun()
         return
 
@@ -154,27 +206,21 @@ def show_attendance_tab(school, dept, level):
     st.subheader(f"🟢 Active Attendance — {course_code}")
     st.caption(f"Started {active['date']} at {active['start_time'].replace('-', ':')}")
 
+    shared = [cid for cid, *_ in storage.session_cohorts(active)]
+    host = active.get("cohort")
+    is_host = len(shared) == 1 or (cohort is not None and cohort.id == host)
+    if len(shared) > 1:
+        st.caption("👥 Shared lecture: " + ", ".join(cohort_label(get_cohort(cid)) for cid in shared)
+                   + ("" if is_host else f" — hosted by {cohort_label(get_cohort(host))}"))
+
     if st.button("🔄 Refresh"):
+        if st.session_state.feed is not None:
+            st.session_state.feed.polled_at = None  # asked for: the poll gap only paces unrequested reruns
         reload_session()
         st.rerun()
 
-    # Code display
-    code, slot, secs_left = get_current_code(started_at)
-    c1, c2 = st.columns(2)
-    with c1:
-        st.markdown(
-            f"""<div style="background:#1a1a2e;border-radius:16px;padding:24px;text-align:center;border:2px solid #00ff88">
-            <p style="color:#aaa;margin:0;font-size:13px;letter-spacing:2px">CURRENT CODE</p>
-            <h1 style="color:#00ff88;font-size:72px;letter-spacing:12px;margin:8px 0;font-family:monospace">{code}</h1>
-            <p style="color:#666;font-size:12px">Share verbally — do NOT display on screen for students</p>
-            </div>""", unsafe_allow_html=True)
-    with c2:
-        st.markdown(
-            f"""<div style="background:#1a1a2e;border-radius:16px;padding:24px;text-align:center;border:2px solid #ffb800">
-            <p style="color:#aaa;margin:0;font-size:13px;letter-spacing:2px">REFRESHES IN</p>
-            <h1 style="color:#ffb800;font-size:72px;margin:8px 0">{int(secs_left)}s</h1>
-            <p style="color:#666;font-size:12px">Old codes stop working immediately</p>
-            </div>""", unsafe_allow_html=True)
+    # Code display — ticks in the browser, no reruns needed
+    live_code_clock(started_at)
 
     st.divider()
 
@@ -186,58 +232,77 @@ def show_attendance_tab(school, dept, level):
         with mc2: first = st.text_input("First Name*")
         with mc3: middle = st.text_input("Middle Name")
         matric = st.text_input("Matric Number*")
+        if len(shared) > 1:
+            add_cohort = st.selectbox("Cohort", shared, format_func=lambda cid: cohort_label(get_cohort(cid)),
+                                      index=shared.index(cohort.id) if cohort and cohort.id in shared else 0)
         add_btn = st.form_submit_button("Add Student")
 
     if add_btn:
-        entries = st.session_state.current_entries
+        dedupe = st.session_state.dedupe
         if not surname or not first or not matric:
             st.error("Surname, First Name and Matric Number are required.")
-        elif is_dup_name(surname, first, middle, entries):
+        elif dedupe.has_name(surname, first, middle, cohort=add_cohort if len(shared) > 1 else None):
             st.error("A student with that name is already in this attendance.")
-        elif is_dup_matric(matric, entries):
+        elif dedupe.has_matric(matric):
             st.error("That matric number is already in this attendance.")
         else:
-            entries.append({
+            entry = {
                 "surname": surname.strip().upper(),
                 "first_name": first.strip().upper(),
                 "middle_name": middle.strip().upper(),
                 "matric": matric.strip().upper(),
                 "timestamp": now_str(),
-            })
-            save_entries(entries)
-            st.success(f"Added: {surname.upper()} {first.upper()}")
-            st.rerun()
+            }
+            if len(shared) > 1:
+                entry["cohort"] = add_cohort
+            result = add_entry(entry)
+            if result == submissions.RESULT_OK:
+                st.success(f"Added: {surname.upper()} {first.upper()}")
+                st.rerun()
+            st.error(RESULT_ERRORS[result])
 
     # Entries table
     entries = st.session_state.current_entries
     st.subheader(f"📝 Current Entries ({len(entries)} students)")
     if entries:
-        df = pd.DataFrame([{
-            "S/N": i+1, "Surname": e["surname"], "First Name": e["first_name"],
-            "Middle Name": e["middle_name"], "Matric No.": e["matric"], "Time": e["timestamp"],
-        } for i, e in enumerate(entries)])
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        with profiler.span("entries_table", rows=len(entries)):
+            df = pd.DataFrame([{
+                "S/N": i+1, "Surname": e["surname"], "First Name": e["first_name"],
+                "Middle Name": e["middle_name"], "Matric No.": e["matric"], "Time": e["timestamp"],
+                **({"Cohort": cohort_label(get_cohort(e.get("cohort", host)))} if len(shared) > 1 else {}),
+            } for i, e in enumerate(entries)])
+            st.dataframe(df, use_container_width=True, hide_index=True)
     else:
         st.info("No entries yet.")
 
+    stats = submissions.write_stats(st.session_state.csv_path)
+    if stats.get("conflicts"):
+        st.caption(f"Write contention: {stats['conflicts']} conflicts over {stats['writes']} writes, "
+                   f"retries added up to {stats['retry_seconds_max']:.2f}s")
+    queue = submissions.queue_stats()
+    if queue["submitted"]:
+        st.caption(f"Submission queue: {queue['waiting']} waiting, {queue['batches_queued']} batches queued, "
+                   f"{queue['batches_running']}/{queue['workers']} workers busy · "
+                   f"submit-to-record p50 {queue['latency_p50']:.1f}s, p95 {queue['latency_p95']:.1f}s")
+
     st.divider()
 
     # End Attendance
     st.subheader("🔴 End Attendance")
-    if not st.session_state.confirm_end:
+    if not is_host:
+        st.caption("The host cohort's rep ends this session; every cohort's CSV is saved then.")
+    elif not st.session_state.confirm_end:
         if st.button("End Attendance", type="secondary"):
             st.session_state.confirm_end = True
             st.rerun()
     else:
         st.warning(f"Confirm ending attendance for **{course_code}**?  \n"
-                   "The CSV will be saved and the session closed.")
+                   + ("One CSV per cohort will be saved" if len(shared) > 1 else "The CSV will be saved")
+                   + " and the session closed.")
         yes_col, no_col = st.columns(2)
         with yes_col:
             if st.button("✅ Yes, End It", type="primary"):
-                own_key = gs.att_key(school, dept, level)
-                active_all, sha = gs.get_active_attendances()
-                active_all.pop(own_key, None)
-                gs.set_active_attendances(active_all, sha)
+                storage.end_session(active)
                 st.session_state.active_session = None
                 st.session_state.current_entries = []
                 st.session_state.confirm_end = False
@@ -252,6 +317,7 @@ def show_attendance_tab(school, dept, level):
 
 
 # ─── Edit Tab ─────────────────────────────────────────────────────────────────
+@profiler.traced()
 def show_edit_tab():
     st.subheader("✏️ Edit Attendance Entries")
     if not st.session_state.active_session:
@@ -279,58 +345,160 @@ def show_edit_tab():
         with sc: save_btn = st.form_submit_button("💾 Save")
         with dc: del_btn = st.form_submit_button("🗑️ Delete")
 
-    others = [e2 for i, e2 in enumerate(entries) if i != idx]
+    dedupe = st.session_state.dedupe
 
     if save_btn:
         if not new_sn or not new_fn or not new_mat:
             st.error("Required fields missing.")
-        elif is_dup_name(new_sn, new_fn, new_mn, others):
+        elif dedupe.has_name(new_sn, new_fn, new_mn, ignore=e):
             st.error("Duplicate name.")
-        elif is_dup_matric(new_mat, others):
+        elif dedupe.has_matric(new_mat, ignore=e):
             st.error("Duplicate matric number.")
         else:
-            entries[idx] = {"surname": new_sn.strip().upper(), "first_name": new_fn.strip().upper(),
-                            "middle_name": new_mn.strip().upper(), "matric": new_mat.strip().upper(),
-                            "timestamp": e["timestamp"]}
-            save_entries(entries)
-            st.success("Entry updated!")
-            st.rerun()
+            result = update_entry(e, {"surname": new_sn.strip().upper(), "first_name": new_fn.strip().upper(),
+                                      "middle_name": new_mn.strip().upper(), "matric": new_mat.strip().upper(),
+                                      "timestamp": e["timestamp"]})
+            if result == submissions.RESULT_OK:
+                st.success("Entry updated!")
+                st.rerun()
+            st.error(RESULT_ERRORS[result])
 
     if del_btn:
-        entries.pop(idx)
-        save_entries(entries)
-        st.success("Entry deleted.")
-        st.rerun()
+        result = update_entry(e, None)
+        if result == submissions.RESULT_OK:
+            st.success("Entry deleted.")
+            st.rerun()
+        st.error(RESULT_ERRORS[result])
 
 
 # ─── Download Tab ─────────────────────────────────────────────────────────────
+@profiler.traced()
 def show_download_tab(school, dept, level):
     st.subheader("📥 Download Attendance Records")
     st.caption(f"{dept} · {level}L — all sessions (past and present)")
 
     with st.spinner("Fetching records..."):
-        files = gs.list_attendance_csvs(school, dept, level)
+        rows = storage.list_sessions(school, dept, level)
 
-    if not files:
+    if not rows:
         st.info("No records found yet.")
         return
 
-    for fpath in files:
+    # File contents are only fetched when a download is asked for
+    active = st.session_state.active_session
+    live_path = st.session_state.csv_path if active else None
+    fetched = st.session_state.downloads
+    for row in rows:
+        fpath = row["path"]
         fname = fpath.split("/")[-1]
+        # A guest cohort's row of a shared session names the host's log as its store
+        live = live_path is not None and live_path in (fpath, row.get("store"))
         col1, col2 = st.columns([4, 1])
         with col1:
-            st.markdown(f"📄 `{fname}`")
+            count = f" · {row['entries']} students" if "entries" in row and not live else ""
+            st.markdown(f"📄 `{fname}`{count}" + (" — *in progress*" if live else ""))
         with col2:
-            content, _ = gs.read_file(fpath)
-            if content:
+            if live:
                 st.download_button(
-                    "⬇️ Download", data=content, file_name=fname,
+                    "⬇️ Download", data=entries_to_csv(storage.cohort_entries(
+                        st.session_state.current_entries, row.get("cohort", active.get("cohort")),
+                        active.get("cohort"))),
+                    file_name=fname, mime="text/csv", key=f"dl_{fpath}"
+                )
+            elif fpath in fetched:
+                st.download_button(
+                    "⬇️ Download", data=fetched[fpath], file_name=fname,
                     mime="text/csv", key=f"dl_{fpath}"
                 )
+            elif st.button("Prepare", key=f"prep_{fpath}"):
+                fetched[fpath] = storage.read_session_csv(row) or ""
+                st.rerun()
+
+    st.divider()
+    show_bulk_export(school, dept, level, rows)
+
+
+@profiler.traced()
+def show_bulk_export(school, dept, level, rows):
+    st.subheader("📦 Download Several as ZIP")
+    dates = sorted(date.fromisoformat(r["date"]) for r in rows if r.get("date"))
+    if not dates:
+        return
+    picked_range = st.date_input("Sessions between", value=(dates[0], dates[-1]),
+                                 min_value=dates[0], max_value=dates[-1])
+    if len(picked_range) != 2:
+        return
+    courses = sorted({r["course_code"] for r in rows if r.get("course_code")})
+    picked_courses = st.multiselect("Courses (all if empty)", courses)
+    picked = [r for r in rows if r.get("date")
+              and picked_range[0] <= date.fromisoformat(r["date"]) <= picked_range[1]
+              and (not picked_courses or r.get("course_code") in picked_courses)]
+    st.caption(f"{len(picked)} session(s) selected")
+
+    export_key = tuple(r["path"] for r in picked)
+    if st.button("Build ZIP", disabled=not picked):
+        with st.spinner(f"Collecting {len(picked)} files..."):
+            st.session_state.zip_export = (export_key, exports.build_zip(picked))
+    ready = st.session_state.zip_export
+    if ready and ready[0] == export_key:
+        st.download_button(
+            "⬇️ Download ZIP", data=ready[1], mime="application/zip",
+            file_name=f"{storage.att_dir(school, dept, level).split('/', 1)[1].replace('/', '_')}"
+                      f"_{picked_range[0]}_{picked_range[1]}.zip",
+        )
+
+
+# ─── Analytics Tab ────────────────────────────────────────────────────────────
+@profiler.traced()
+def show_analytics_tab(school, dept, level):
+    st.subheader("📊 Attendance Analytics")
+    st.caption(f"{dept} · {level}L — attendance per student, session and course")
+
+    rows = storage.list_sessions(school, dept, level)
+    courses = sorted({r["course_code"] for r in rows if r.get("course_code")})
+    if not courses:
+        st.info("No records found yet.")
+        return
+    picked = st.multiselect("Courses (all if empty)", courses, key="analytics_courses")
+
+    # Sessions are only downloaded on request; the result is kept until the selection changes
+    key = (tuple(picked), len(rows))
+    if st.button("Load analytics"):
+        with st.spinner(f"Reading {len(rows)} session file(s)..."):
+            st.session_state.analytics = (key, analytics.load_cohort(school, dept, level, picked))
+    loaded = st.session_state.analytics
+    if not loaded or loaded[0] != key:
+        return
+    data = loaded[1]
+    if data.entries.empty:
+        st.info("No sign-ins in these sessions yet.")
+        return
+
+    rates = analytics.attendance_rates(data)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Sessions", len(data.sessions))
+    c2.metric("Students", rates["matric"].nunique())
+    c3.metric("Median rate", f"{rates['rate'].median():.0f}%")
+
+    st.markdown("**Per student**")
+    st.dataframe(rates, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Download rates CSV", data=analytics.rates_csv(rates), mime="text/csv",
+        file_name=f"{storage.att_dir(school, dept, level).split('/', 1)[1].replace('/', '_')}_rates.csv",
+    )
+
+    st.markdown("**Per session**")
+    counts = analytics.session_counts(data)
+    st.dataframe(counts[["date", "start_time", "course_code", "students", "median_minutes_late"]],
+                 use_container_width=True, hide_index=True)
+
+    st.markdown("**Minutes after the start students signed in**")
+    st.bar_chart(analytics.lateness(data))
 
 
 # ─── Entry ────────────────────────────────────────────────────────────────────
-if not st.session_state.rep_logged_in:
-    show_login()
-else:
-    show_dashboard()
+with PAGE_RUNS.time(page="course_rep"), profiler.span("page.course_rep"):
+    if not st.session_state.rep_logged_in:
+        show_login()
+    else:
+        show_dashboard()
@@ -1,5 +1,4 @@
 import uuid
-import json
 import streamlit as st
 
 st.set_page_config(page_title="Student Recorder — FUTO Attendance", page_icon="🎓", layout="centered")
@@ -7,9 +6,14 @@ st.set_page_config(page_title="Student Recorder — FUTO Attendance", page_icon=
 import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from futo_data import get_schools, get_departments, get_levels
-from utils import is_code_valid, is_dup_name, is_dup_matric, entries_to_csv, csv_to_entries, now_str
-import github_storage as gs
+from futo_data import get_schools, get_departments, get_levels, cohort_for
+from utils import is_code_valid, now_str
+import metrics
+import profiler
+import storage
+import submissions
+
+PAGE_RUNS = metrics.histogram("page_run_seconds", "Streamlit script runs", ("page",))
 
 # ─── Device ID via cookies ────────────────────────────────────────────────────
 # We use streamlit-cookies-manager. If not available, fallback to session state.
@@ -46,147 +50,193 @@ def get_device_id():
     return st.session_state.device_id
 
 
-def device_already_signed(device_id, csv_path):
-    dev_path = gs.get_devices_path(csv_path)
-    content, _ = gs.read_file(dev_path)
-    if content is None:
-        return False
-    try:
-        return device_id in json.loads(content)
-    except Exception:
-        return False
-
+# ─── Submission status ────────────────────────────────────────────────────────
+# Submitting hands the entry to the background queue and keeps a receipt per
+# session in st.session_state; the page shows its status until it resolves.
 
-def register_device(device_id, csv_path):
-    dev_path = gs.get_devices_path(csv_path)
-    content, sha = gs.read_file(dev_path)
-    try:
-        devices = json.loads(content) if content else []
-    except Exception:
-        devices = []
-    if device_id not in devices:
-        devices.append(device_id)
-    gs.write_file(dev_path, json.dumps(devices), "Register device", sha)
+if "receipts" not in st.session_state:
+    st.session_state.receipts = {}  # csv_path -> (receipt, entry)
+    st.session_state.celebrated = set()
 
 
-# ─── Main ─────────────────────────────────────────────────────────────────────
-st.title("🎓 Student Attendance Sign-In")
-st.caption("Federal University of Technology, Owerri")
+def show_pending(receipt):
+    """Rechecks the receipt (every second where st.fragment exists) and reruns once it resolves."""
+    status, _ = submissions.get_queue().status(receipt)
+    if status != submissions.STATUS_PENDING:
+        st.rerun()
+    st.info(f"⏳ **Submitted — recording your attendance...**  \n"
+            f"Receipt: `{receipt}`. Keep this page open; it updates by itself.")
+    if not hasattr(st, "fragment"):
+        st.button("🔄 Check status")
 
-device_id = get_device_id()
 
-# Step 1 — Location
-st.subheader("Step 1: Select Your Details")
-school = st.selectbox("School", ["— Select School —"] + get_schools())
-if school.startswith("—"):
-    st.stop()
+if hasattr(st, "fragment"):
+    show_pending = st.fragment(run_every=1)(show_pending)
 
-dept = st.selectbox("Department", ["— Select Department —"] + get_departments(school))
-if dept.startswith("—"):
-    st.stop()
 
-levels = get_levels(school, dept)
-level_disp = st.selectbox("Level", ["— Select Level —"] + [f"{l}L" for l in levels])
-if level_disp.startswith("—"):
-    st.stop()
-level = level_disp.replace("L", "")
+def show_receipt(csv_path, course_code):
+    """Shows the outcome of this browser's submission to the session, if any; True if shown."""
+    receipt, entry = st.session_state.receipts.get(csv_path, (None, None))
+    if receipt is None:
+        return False
+    status, result = submissions.get_queue().status(receipt)
+    if status == submissions.STATUS_PENDING:
+        show_pending(receipt)
+        return True
+    if status == submissions.STATUS_CONFIRMED and result in (submissions.RESULT_OK, submissions.RESULT_DEVICE):
+        if result == submissions.RESULT_DEVICE:
+            st.info("✅ You have already signed this attendance from this device.")
+            return True
+        if receipt not in st.session_state.celebrated:
+            st.session_state.celebrated.add(receipt)
+            st.balloons()
+        st.success(
+            f"🎉 **Attendance recorded!**  \n"
+            f"Name: **{entry['surname']} {entry['first_name']} {entry['middle_name']}**  \n"
+            f"Matric: **{entry['matric']}**  \n"
+            f"Course: **{course_code}**"
+        )
+        st.info("You're marked present. You cannot sign again from this device for this session.")
+        return True
+    # Rejected or lost: forget the receipt and let the student submit again
+    del st.session_state.receipts[csv_path]
+    if result == submissions.RESULT_DUP_NAME:
+        st.error("❌ A student with that name is already in this attendance.")
+    elif result == submissions.RESULT_DUP_MATRIC:
+        st.error("❌ That matric number is already registered in this attendance.")
+    elif result == submissions.RESULT_CLOSED:
+        st.error(CLOSED_MESSAGE)
+    else:
+        st.error("❌ Your attendance could not be saved. Please submit again.")
+    return False
 
-st.divider()
 
-# Step 2 — Check active attendance
-with st.spinner("Checking for active attendance..."):
-    active_all, _ = gs.get_active_attendances()
+CLOSED_MESSAGE = "❌ The attendance ended before your entry could be saved. You were not marked present."
 
-key = gs.att_key(school, dept, level)
 
-if key not in active_all:
-    st.warning("⚠️ **No active attendance** found for your school/department/level.")
-    st.caption("Ask your course rep if attendance is currently running.")
-    st.stop()
+def show_closed():
+    """Once the session is gone the receipt check above is never reached: report entries it refused."""
+    for csv_path, (receipt, _) in list(st.session_state.receipts.items()):
+        status, result = submissions.get_queue().status(receipt)
+        if status == submissions.STATUS_CONFIRMED and result == submissions.RESULT_CLOSED:
+            del st.session_state.receipts[csv_path]
+            st.error(CLOSED_MESSAGE)
 
-session = active_all[key]
-course_code = session["course_code"]
-started_at = session["started_at"]
-csv_path = session["csv_path"]
 
-st.success(f"✅ Active attendance found: **{course_code}**")
+# ─── Main ─────────────────────────────────────────────────────────────────────
+def main():
+    st.title("🎓 Student Attendance Sign-In")
+    st.caption("Federal University of Technology, Owerri")
 
-# Check if device already signed
-if device_already_signed(device_id, csv_path):
-    st.info("✅ You have already signed this attendance from this device.")
-    st.caption("Each device can only sign once per attendance session.")
-    st.stop()
+    device_id = get_device_id()
 
-st.divider()
+    # Step 1 — Location
+    st.subheader("Step 1: Select Your Details")
+    school = st.selectbox("School", ["— Select School —"] + get_schools())
+    if school.startswith("—"):
+        st.stop()
 
-# Step 3 — Enter Code
-st.subheader("Step 2: Enter the 4-Digit Code")
-st.caption("Ask your course rep for the current code. Only works if you're in the lecture hall.")
+    dept = st.selectbox("Department", ["— Select Department —"] + get_departments(school))
+    if dept.startswith("—"):
+        st.stop()
 
-entered_code = st.text_input("4-Digit Code", max_chars=4, placeholder="e.g. 4782").strip()
+    levels = get_levels(school, dept)
+    level_disp = st.selectbox("Level", ["— Select Level —"] + [f"{l}L" for l in levels])
+    if level_disp.startswith("—"):
+        st.stop()
+    level = level_disp.replace("L", "")
 
-if not entered_code:
-    st.stop()
+    st.divider()
 
-if not is_code_valid(entered_code, started_at):
-    st.error("❌ Wrong or expired code. The code changes every 10 seconds — ask your rep for the latest one.")
-    st.stop()
+    # Step 2 — Check active attendance
+    with st.spinner("Checking for active attendance..."):
+        session = storage.get_active_session_cached(school, dept, level)
 
-st.success("✅ Code accepted! Fill in your details below.")
-st.divider()
+    if session is None:
+        show_closed()
+        st.warning("⚠️ **No active attendance** found for your school/department/level.")
+        st.caption("Ask your course rep if attendance is currently running.")
+        st.stop()
 
-# Step 4 — Student Details
-st.subheader("Step 3: Enter Your Details")
-st.caption("Double-check before submitting — you cannot change your entry afterwards.")
+    course_code = session["course_code"]
+    started_at = session["started_at"]
+    csv_path = session["csv_path"]
 
-with st.form("student_form"):
-    f1, f2, f3 = st.columns(3)
-    with f1: surname = st.text_input("Surname*")
-    with f2: first = st.text_input("First Name*")
-    with f3: middle = st.text_input("Middle Name")
-    matric = st.text_input("Matric Number*", placeholder="e.g. 2021/ND/12345")
-    submit = st.form_submit_button("✅ Submit Attendance", type="primary")
+    st.success(f"✅ Active attendance found: **{course_code}**")
+    if len(session.get("cohorts", [])) > 1:
+        st.caption(f"👥 Shared lecture with {len(session['cohorts']) - 1} other department(s)/level(s) — same code.")
 
-if submit:
-    if not surname or not first or not matric:
-        st.error("Surname, First Name and Matric Number are required.")
+    if show_receipt(csv_path, course_code):
         st.stop()
 
-    # Revalidate code (may have expired during form fill)
-    if not is_code_valid(entered_code, started_at):
-        st.error("⏱️ The code expired while you were filling in. Get the new code from your rep.")
+    # Check if device already signed
+    if submissions.device_signed(csv_path, device_id):
+        st.info("✅ You have already signed this attendance from this device.")
+        st.caption("Each device can only sign once per attendance session.")
         st.stop()
 
-    # Load current entries for duplicate check
-    content, csv_sha = gs.read_file(csv_path)
-    entries = csv_to_entries(content) if content else []
+    st.divider()
 
-    if is_dup_name(surname, first, middle, entries):
-        st.error("❌ A student with that name is already in this attendance.")
+    # Step 3 — Enter Code
+    st.subheader("Step 2: Enter the 4-Digit Code")
+    st.caption("Ask your course rep for the current code. Only works if you're in the lecture hall.")
+
+    entered_code = st.text_input("4-Digit Code", max_chars=4, placeholder="e.g. 4782").strip()
+
+    if not entered_code:
         st.stop()
-    if is_dup_matric(matric, entries):
-        st.error("❌ That matric number is already registered in this attendance.")
+
+    if not is_code_valid(entered_code, started_at):
+        st.error("❌ Wrong or expired code. The code changes every 10 seconds — ask your rep for the latest one.")
         st.stop()
 
-    # Write entry
-    entry = {
-        "surname": surname.strip().upper(),
-        "first_name": first.strip().upper(),
-        "middle_name": middle.strip().upper(),
-        "matric": matric.strip().upper(),
-        "timestamp": now_str(),
-    }
-    entries.append(entry)
-    gs.write_file(csv_path, entries_to_csv(entries), "Add student entry", csv_sha)
-
-    # Lock this device
-    register_device(device_id, csv_path)
-
-    st.balloons()
-    st.success(
-        f"🎉 **Attendance recorded!**  \n"
-        f"Name: **{entry['surname']} {entry['first_name']} {entry['middle_name']}**  \n"
-        f"Matric: **{entry['matric']}**  \n"
-        f"Course: **{course_code}**"
-    )
-    st.info("You're marked present. You cannot sign again from this device for this session.")
+    st.success("✅ Code accepted! Fill in your details below.")
+    st.divider()
+
+    # Step 4 — Student Details
+    st.subheader("Step 3: Enter Your Details")
+    st.caption("Double-check before submitting — you cannot change your entry afterwards.")
+
+    with st.form("student_form"):
+        f1, f2, f3 = st.columns(3)
+        with f1: surname = st.text_input("Surname*")
+        with f2: first = st.text_input("First Name*")
+        with f3: middle = st.text_input("Middle Name")
+        matric = st.text_input("Matric Number*", placeholder="e.g. 2021/ND/12345")
+        submit = st.form_submit_button("✅ Submit Attendance", type="primary")
+
+    if submit:
+        if not surname or not first or not matric:
+            st.error("Surname, First Name and Matric Number are required.")
+            st.stop()
+
+        # Revalidate code (may have expired during form fill)
+        if not is_code_valid(entered_code, started_at):
+            st.error("⏱️ The code expired while you were filling in. Get the new code from your rep.")
+            st.stop()
+
+        # Queue the entry; duplicates and the device lock are checked again when the batch is written
+        entry = {
+            "surname": surname.strip().upper(),
+            "first_name": first.strip().upper(),
+            "middle_name": middle.strip().upper(),
+            "matric": matric.strip().upper(),
+            "timestamp": now_str(),
+        }
+        if "cohorts" in session:
+            entry["cohort"] = cohort_for(school, dept, level).id  # which cohort's CSV it goes to at the end
+        result = submissions.precheck(csv_path, entry)
+        if result == submissions.RESULT_DUP_NAME:
+            st.error("❌ A student with that name is already in this attendance.")
+            st.stop()
+        if result == submissions.RESULT_DUP_MATRIC:
+            st.error("❌ That matric number is already registered in this attendance.")
+            st.stop()
+
+        receipt = submissions.get_queue().enqueue(csv_path, entry, device_id)
+        st.session_state.receipts[csv_path] = (receipt, entry)
+        st.rerun()
+
+
+with PAGE_RUNS.time(page="student_recorder"), profiler.span("page.student_recorder"):
+    main()
@@ -0,0 +1,150 @@
+import os
+import hmac
+import time
+import streamlit as st
+import pandas as pd
+
+st.set_page_config(page_title="Admin — FUTO Attendance", page_icon="🛠️", layout="wide")
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import analytics
+import github_storage
+import metrics
+import storage
+import submissions
+from settings import setting
+
+
+# ─── Login ────────────────────────────────────────────────────────────────────
+if "admin_logged_in" not in st.session_state:
+    st.session_state.admin_logged_in = False
+
+st.title("🛠️ Admin")
+
+expected = setting("ADMIN_PASSWORD")
+if not expected:
+    st.info("The admin view is off. Set `ADMIN_PASSWORD` in the app secrets to turn it on.")
+    st.stop()
+
+if not st.session_state.admin_logged_in:
+    password = st.text_input("Admin password", type="password")
+    if st.button("Login →", type="primary"):
+        if hmac.compare_digest(password.encode("utf-8"), str(expected).encode("utf-8")):
+            st.session_state.admin_logged_in = True
+            st.rerun()
+        st.error("❌ Incorrect password.")
+    st.stop()
+
+if st.button("🔄 Refresh"):
+    st.rerun()
+
+
+# ─── GitHub rate limit ────────────────────────────────────────────────────────
+st.subheader("GitHub API budget")
+b = github_storage.rate_budget()
+STAGE_NOTES = {
+    github_storage.BUDGET_OK:       "Normal operation.",
+    github_storage.BUDGET_LOW:      "Background polling (rep dashboards) is backing off.",
+    github_storage.BUDGET_CRITICAL: "Polling backed off and cached values are kept longer.",
+    github_storage.BUDGET_RESERVE:  "Background polling is slowed right down; submissions are never throttled.",
+}
+if b["remaining"] is None:
+    st.caption(f"No GitHub responses seen by this app instance yet (storage backend: {storage.get_backend().name}).")
+else:
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Remaining", f"{b['remaining']} / {b['limit']}")
+    c2.metric("Resets in", f"{int(b['reset_in'] // 60)} min" if b["reset_in"] is not None else "—")
+    c3.metric("Stage", b["stage"])
+    c4.metric("Poll × / TTL ×", f"{b['poll_factor']} / {b['ttl_factor']}")
+    st.caption(STAGE_NOTES[b["stage"]])
+    if b["retry_after_in"]:
+        st.warning(f"GitHub asked us to wait {b['retry_after_in']:.0f}s (secondary rate limit).")
+
+cache = github_storage.cache_stats()
+st.caption(f"Read cache: {cache['entries']}/{cache['max_entries']} files, "
+           f"{cache['hits']} hits (304) / {cache['misses']} misses — hit rate {cache['hit_rate']:.0%}")
+blobs = storage.blob_cache().stats()
+st.caption(f"Ended sessions cache: {blobs['entries']}/{blobs['max_entries']} parsed in memory, "
+           f"{blobs['disk_files']} files ({blobs['disk_bytes'] / 1e6:.1f} of {blobs['max_bytes'] / 1e6:.0f} MB) "
+           f"in `{blobs['directory']}`")
+
+
+# ─── Submissions ──────────────────────────────────────────────────────────────
+st.subheader("Submission queue")
+q = submissions.queue_stats()
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Waiting", q["waiting"])
+c2.metric("Workers busy", f"{q['batches_running']} / {q['workers']}")
+c3.metric("Confirmed / failed", f"{q['confirmed']} / {q['failed']}")
+c4.metric("Submit → record p95", f"{q['latency_p95']:.1f}s")
+
+stats = submissions.write_stats()
+if stats:
+    st.dataframe(pd.DataFrame([dict(session=path, **s) for path, s in stats.items()]),
+                 use_container_width=True, hide_index=True)
+else:
+    st.caption("No writes from this app instance yet.")
+
+
+# ─── Course analytics ─────────────────────────────────────────────────────────
+st.subheader("Course attendance")
+st.caption("One course across every cohort that holds it (e.g. a general course).")
+course = st.text_input("Course code", placeholder="e.g. GST 101").strip()
+if st.button("Load course", disabled=not course):
+    with st.spinner("Reading sessions..."):
+        st.session_state.admin_course = (course, analytics.load_course(course))
+loaded = st.session_state.get("admin_course")
+if loaded and loaded[0] == course:
+    data = loaded[1]
+    if data.entries.empty:
+        st.info(f"No sign-ins found for {course}.")
+    else:
+        rates = analytics.attendance_rates(data)
+        per_cohort = (rates.groupby("cohort")
+                      .agg(students=("matric", "nunique"), sessions=("sessions", "max"),
+                           median_rate=("rate", "median"))
+                      .reset_index())
+        st.dataframe(per_cohort, use_container_width=True, hide_index=True)
+        st.dataframe(rates, use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Download rates CSV", data=analytics.rates_csv(rates), mime="text/csv",
+                           file_name=f"{course.replace(' ', '').upper()}_rates.csv")
+
+
+# ─── Metrics ──────────────────────────────────────────────────────────────────
+st.subheader("Metrics")
+rows = metrics.rows()
+timings = [r for r in rows if "count" in r]
+counts = [r for r in rows if "value" in r]
+
+
+def label_str(labels):
+    return ", ".join(f"{k}={v}" for k, v in labels.items() if v)
+
+
+if timings:
+    st.caption("Timings (seconds; p50/p95 are bucket upper bounds)")
+    st.dataframe(pd.DataFrame([{
+        "metric": r["metric"], "labels": label_str(r["labels"]), "count": r["count"],
+        "mean": round(r["mean"], 4), "p50": r["p50"], "p95": r["p95"],
+    } for r in timings]), use_container_width=True, hide_index=True)
+if counts:
+    st.caption("Counters and gauges")
+    st.dataframe(pd.DataFrame([{
+        "metric": r["metric"], "labels": label_str(r["labels"]), "value": r["value"],
+    } for r in counts]), use_container_width=True, hide_index=True)
+
+text = metrics.render()
+mc1, mc2 = st.columns(2)
+with mc1:
+    st.download_button("⬇️ Prometheus text", data=text, file_name="futo_metrics.prom", mime="text/plain")
+with mc2:
+    if st.button("💾 Write to METRICS_FILE"):
+        path = metrics.dump()
+        if path:
+            st.success(f"Written to {path}")
+        else:
+            st.info("Set `METRICS_FILE` in the secrets (or env) to dump metrics to a file.")
+
+st.caption(f"Figures are for this app instance since it started · {time.strftime('%H:%M:%S')}")
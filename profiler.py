@@ -0,0 +1,108 @@
+"""
+Span profiler for FUTO ULAS.
+
+Off unless PROFILE = "1" (secrets.toml or env var). When on, nested timed
+spans (page runs, dashboard sections, storage and GitHub calls, utils) are
+written as Chrome trace events, one root span at a time, to PROFILE_FILE:
+
+  PROFILE      = "1"
+  PROFILE_FILE = "/tmp/futo_trace.json"    # default; ".jsonl" for one event per line
+
+Load the .json file in chrome://tracing or https://ui.perfetto.dev. Each
+thread is its own track, so submission workers show up next to page runs.
+
+When off, @traced returns the function unchanged and span() hands back one
+shared no-op context manager, so instrumented code pays next to nothing.
+"""
+
+import os
+import json
+import time
+import functools
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+from settings import setting
+
+
+_enabled = None
+_NULL = nullcontext()
+_local = threading.local()   # .stack: open spans; .events: finished ones awaiting their root
+_file_lock = threading.Lock()
+_started = set()             # trace files this process has opened
+
+
+def enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = str(setting("PROFILE", "0")).strip().lower() in ("1", "true", "yes", "on")
+    return _enabled
+
+
+def trace_path():
+    return setting("PROFILE_FILE", "") or os.path.join(tempfile.gettempdir(), "futo_trace.json")
+
+
+def _write(events):
+    path = trace_path()
+    jsonl = path.endswith(".jsonl")
+    with _file_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            if not jsonl and path not in _started and f.tell() == 0:
+                f.write("[\n")  # Chrome's array format allows the closing bracket to be missing
+            _started.add(path)
+            for e in events:
+                f.write(json.dumps(e, separators=(",", ":")) + ("\n" if jsonl else ",\n"))
+
+
+@contextmanager
+def _span(name, args):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+        _local.events = []
+    stack.append(name)
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        stack.pop()
+        event = {"name": name, "ph": "X", "ts": start // 1000, "dur": (end - start) // 1000,
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        _local.events.append(event)
+        if not stack:
+            events, _local.events = _local.events, []
+            try:
+                _write(events)
+            except OSError:
+                pass
+
+
+def span(name, **args):
+    """`with profiler.span("reload_session", path=p):` — a no-op unless profiling is on."""
+    if not enabled():
+        return _NULL
+    return _span(name, args)
+
+
+def traced(name=None, arg=None):
+    """
+    Decorator: each call becomes a span named `name` (default module.function).
+    With `arg`, the first positional argument is recorded under that key.
+    """
+    def wrap(fn):
+        if not enabled():
+            return fn
+        module = "" if fn.__module__ == "__main__" else f"{fn.__module__}."  # pages run as __main__
+        label = name or f"{module}{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            with _span(label, {arg: a[0]} if arg and a else None):
+                return fn(*a, **kw)
+        return inner
+    return wrap
@@ -0,0 +1,17 @@
+"""
+Settings for FUTO ULAS.
+
+Every option is looked up in Streamlit secrets (secrets.toml) first, then in
+an environment variable of the same name, so the app, the offline scripts and
+the benchmarks are configured the same way.
+"""
+
+import os
+
+
+def setting(name, default=""):
+    try:
+        import streamlit as st  # imported here: offline scripts may not have it
+        return st.secrets[name]
+    except Exception:
+        return os.environ.get(name, default)
@@ -0,0 +1,1031 @@
+"""
+Storage backends for FUTO ULAS.
+
+Pages talk to storage through the module-level functions below, which
+delegate to one backend picked from config (secrets.toml or env vars):
+
+  STORAGE_BACKEND = "github"   # "github" (default), "local" or "memory"
+  STORAGE_DIR     = "/srv/futo-attendance-data"   # local backend only
+  ACTIVE_INDEX    = "1"        # "0" to stop maintaining active_attendances.json
+  STORAGE_PATHS   = "names"    # "ids": attendances/<cohort id>/ instead of names
+
+Every backend uses the same paths as the GitHub data repo
+(attendances/<School>/<Dept>/<Level>L/..., active_attendances.json),
+and the same sha semantics: a write must carry the sha of the version
+it replaces, otherwise it is rejected with ShaConflict.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import NamedTuple
+from collections import OrderedDict
+import requests
+
+import github_storage
+import metrics
+import profiler
+from settings import setting
+from github_storage import ShaConflict
+from futo_data import ATTENDANCES_ROOT, cohort_for, get_cohort, safe_name
+from utils import entries_to_csv, csv_to_entries, entries_to_log, parse_log, hash_device
+
+log = logging.getLogger(__name__)
+
+
+def blob_sha(content_str):
+    """Git blob sha1 of the content, same as the sha GitHub reports."""
+    data = content_str.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _check_sha(path, current_sha, sha):
+    if current_sha is None:
+        return
+    if not sha:
+        raise ShaConflict(f"Storage write conflict 422: sha required to update {path}")
+    if sha != current_sha:
+        raise ShaConflict(f"Storage write conflict 409: {path} does not match {sha}")
+
+
+# ─── Backends ─────────────────────────────────────────────────────────────────
+
+class StorageBackend:
+    """
+    Base class. Subclasses implement read_file, write_file and
+    list_files_in_dir; JSON and attendance helpers are built on those.
+    """
+
+    name = "base"
+
+    def read_file(self, path):
+        """Returns (content_str, sha) or (None, None)."""
+        raise NotImplementedError
+
+    def write_file(self, path, content_str, message, sha=None):
+        """Writes the file and returns its new sha."""
+        raise NotImplementedError
+
+    def list_files_in_dir(self, path_prefix):
+        raise NotImplementedError
+
+    def list_blobs(self, path_prefix):
+        """{path: blob sha} under the prefix; sha is None where the listing cannot tell it cheaply."""
+        return dict.fromkeys(self.list_files_in_dir(path_prefix))
+
+    def append_file(self, path, content_str, message, sha=None):
+        """
+        Appends to the file, creating it if needed. With `sha`, the append
+        only happens if the file still has that sha (else ShaConflict).
+        Returns the new sha, or None when the backend cannot know it without
+        re-reading the file. The Contents API has no append, so by default
+        this is read + write.
+        """
+        current, current_sha = self.read_file(path)
+        if sha and sha != current_sha:
+            raise ShaConflict(f"Storage write conflict 409: {path} does not match {sha}")
+        return self.write_file(path, (current or "") + content_str, message, current_sha)
+
+    def read_tail(self, path, offset, version=None):
+        """
+        Returns (tail, version): the file's bytes from `offset` on, undecoded
+        (the offset may fall inside a character of a rewritten file), and a
+        token that changes whenever the file does. A file still at `version`
+        gives (b"", version). (None, None) if the file does not exist. By
+        default the token is the sha and the whole file is read (GitHub
+        answers an unchanged file from its ETag cache).
+        """
+        content, sha = self.read_file(path)
+        if content is None:
+            return None, None
+        if sha == version:
+            return b"", sha
+        return content.encode("utf-8")[offset:], sha
+
+    def read_json(self, path):
+        content, sha = self.read_file(path)
+        if content is None:
+            return None, None
+        return json.loads(content), sha
+
+    def write_json(self, path, data, message, sha=None):
+        return self.write_file(path, json.dumps(data, indent=2, ensure_ascii=False), message, sha)
+
+    def get_active_attendances(self):
+        data, sha = self.read_json(ACTIVE_PATH)
+        return (data or {}), sha
+
+    def set_active_attendances(self, data, sha=None):
+        return self.write_json(ACTIVE_PATH, data, "Update active attendances", sha)
+
+    def list_sessions(self, school, dept, level):
+        """The cohort's manifest rows, newest first."""
+        data, _ = self.read_json(get_manifest_path(school, dept, level))
+        if data is not None:
+            rows = data.get("sessions", [])
+        else:
+            # Cohorts with no manifest yet (only sessions from older versions)
+            prefix = att_dir(school, dept, level)
+            rows = [dict(path=f, sha=sha, **parse_csv_name(f))
+                    for f, sha in self.list_blobs(prefix).items() if f.endswith(".csv")]
+        return sorted(rows, key=lambda r: r["path"], reverse=True)
+
+    def list_attendance_csvs(self, school, dept, level):
+        return [r["path"] for r in self.list_sessions(school, dept, level)]
+
+    def get_custom_passwords(self):
+        data, sha = self.read_json(PASSWORDS_PATH)
+        return (data or {}), sha
+
+    def set_custom_passwords(self, data, sha=None):
+        return self.write_json(PASSWORDS_PATH, data, "Update rep passwords", sha)
+
+
+class GitHubBackend(StorageBackend):
+    """The data repo on GitHub, via the Contents API (see github_storage)."""
+
+    name = "github"
+
+    def read_file(self, path):
+        return github_storage.read_file(path)
+
+    def write_file(self, path, content_str, message, sha=None):
+        return github_storage.write_file(path, content_str, message, sha)
+
+    def list_files_in_dir(self, path_prefix):
+        return github_storage.list_files_in_dir(path_prefix)
+
+    def list_blobs(self, path_prefix):
+        return github_storage.list_blobs(path_prefix)
+
+
+class MemoryBackend(StorageBackend):
+    """Process-local dict of path -> content. For tests and benchmarks."""
+
+    name = "memory"
+
+    def __init__(self, files=None):
+        self._files = {}
+        self._lock = threading.Lock()
+        for path, content in (files or {}).items():
+            self._files[path] = (content, blob_sha(content))
+
+    def read_file(self, path):
+        with self._lock:
+            return self._files.get(path, (None, None))
+
+    def write_file(self, path, content_str, message, sha=None):
+        new_sha = blob_sha(content_str)
+        with self._lock:
+            current_sha = self._files.get(path, (None, None))[1]
+            _check_sha(path, current_sha, sha)
+            self._files[path] = (content_str, new_sha)
+        return new_sha
+
+    def append_file(self, path, content_str, message, sha=None):
+        with self._lock:
+            current, current_sha = self._files.get(path, ("", None))
+            if sha:
+                _check_sha(path, current_sha, sha)
+            new_sha = blob_sha(current + content_str)
+            self._files[path] = (current + content_str, new_sha)
+        return new_sha
+
+    def list_files_in_dir(self, path_prefix):
+        with self._lock:
+            return [p for p in self._files if p.startswith(path_prefix)]
+
+    def list_blobs(self, path_prefix):
+        with self._lock:
+            return {p: sha for p, (_, sha) in self._files.items() if p.startswith(path_prefix)}
+
+
+class LocalBackend(StorageBackend):
+    """
+    A directory on this machine laid out like the data repo. Writes go
+    through a temp file + rename so readers never see a half-written file.
+    """
+
+    name = "local"
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def _full(self, path):
+        return os.path.join(self.root, *path.split("/"))
+
+    def _read(self, path):
+        try:
+            with open(self._full(path), encoding="utf-8", newline="") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None, None
+        return content, blob_sha(content)
+
+    def read_file(self, path):
+        return self._read(path)
+
+    def write_file(self, path, content_str, message, sha=None):
+        full = self._full(path)
+        with self._lock:
+            _check_sha(path, self._read(path)[1], sha)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            tmp = f"{full}.tmp{threading.get_ident()}"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(content_str)
+            os.replace(tmp, full)
+        return blob_sha(content_str)
+
+    def append_file(self, path, content_str, message, sha=None):
+        full = self._full(path)
+        with self._lock:
+            if sha:
+                _check_sha(path, self._read(path)[1], sha)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, "a", encoding="utf-8", newline="") as f:
+                f.write(content_str)
+        return None
+
+    def read_tail(self, path, offset, version=None):
+        """Seeks to `offset`; the version is (size, mtime) from a stat, so no read when unchanged."""
+        full = self._full(path)
+        try:
+            with open(full, "rb") as f:
+                info = os.fstat(f.fileno())
+                current = (info.st_size, info.st_mtime_ns)
+                if current == version:
+                    return b"", current
+                f.seek(offset)
+                return f.read(), current
+        except FileNotFoundError:
+            return None, None
+
+    def list_files_in_dir(self, path_prefix):
+        base = self._full(path_prefix)
+        if not os.path.isdir(base):
+            base = os.path.dirname(base)
+        out = []
+        for dirpath, _, filenames in os.walk(base):
+            for fn in filenames:
+                rel = os.path.relpath(os.path.join(dirpath, fn), self.root).replace(os.sep, "/")
+                if rel.startswith(path_prefix) and ".tmp" not in fn:
+                    out.append(rel)
+        return out
+
+
+BACKENDS = {
+    "github": GitHubBackend,
+    "memory": MemoryBackend,
+    "local": LocalBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _make_backend():
+    kind = str(setting("STORAGE_BACKEND", "github")).strip().lower()
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND {kind!r} (expected one of {', '.join(BACKENDS)})")
+    if kind == "local":
+        return LocalBackend(setting("STORAGE_DIR", "") or os.path.dirname(os.path.abspath(__file__)))
+    return BACKENDS[kind]()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _make_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the process-wide backend (benchmarks, tests, one-off scripts)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ─── Process-wide caches ──────────────────────────────────────────────────────
+
+class TTLCache:
+    """
+    Values shared by every Streamlit session in this process. A value is
+    reloaded by its loader once it is older than `ttl` seconds, or after
+    invalidate() — call that whenever this process writes what it caches.
+    The ttl stretches while the GitHub rate-limit budget is critical.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._items = {}  # key -> (loaded_at, value)
+        self._loading = {}  # key -> Lock held while that key's loader runs
+        self._lock = threading.Lock()  # guards the two dicts only; never held across a load
+
+    def get(self, key, loader):
+        ttl = self.ttl * github_storage.budget.ttl_factor()
+        item = self._items.get(key)
+        if item is not None and time.monotonic() - item[0] < ttl:
+            return item[1]
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:  # one load per key at a time; other keys load in parallel
+            item = self._items.get(key)
+            if item is not None and time.monotonic() - item[0] < ttl:
+                return item[1]
+            value = loader()
+            with self._lock:
+                self._items[key] = (time.monotonic(), value)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._items.clear()
+            else:
+                self._items.pop(key, None)
+
+
+PASSWORDS_TTL = 300  # seconds; admin_set_password.py changes show up within this
+ACTIVE_TTL    = 5    # seconds a cohort's running session may be stale for students
+
+_passwords = TTLCache(PASSWORDS_TTL)
+_active    = TTLCache(ACTIVE_TTL)
+
+
+class Blob(NamedTuple):
+    content: str   # the file as stored
+    entries: list  # csv_to_entries(content); shared between callers, so read-only
+
+
+BLOB_CACHE_ENTRIES = 256  # parsed files kept in memory per process
+BLOB_CACHE = metrics.counter("blob_cache_total", "Finished-session CSV lookups by where they were found",
+                             ("result",))
+
+
+_BLOB_FILE = re.compile(r"^[0-9a-f]{40}\.csv$")
+
+
+class BlobCache:
+    """
+    Finished session CSVs by git blob sha, parsed. A sha pins the content,
+    so nothing here ever goes stale: entries are only dropped to stay within
+    bounds, and a dropped one is simply downloaded again. Kept in memory
+    (LRU, `max_entries`) and in `directory`, shared by every process on the
+    box and trimmed to `max_bytes`, oldest use first. Disk files hold the raw
+    CSV only: one is trusted if it still hashes to its name, and the entries
+    are parsed from it again, so nothing unverified is ever served.
+    """
+
+    def __init__(self, directory, max_bytes, max_entries=BLOB_CACHE_ENTRIES):
+        self.directory, self.max_bytes, self.max_entries = directory, max_bytes, max_entries
+        self._items = OrderedDict()  # sha -> Blob
+        self._lock = threading.Lock()
+
+    def _file(self, sha):
+        return os.path.join(self.directory, f"{sha}.csv")
+
+    def get(self, sha):
+        with self._lock:
+            blob = self._items.get(sha)
+            if blob is not None:
+                self._items.move_to_end(sha)
+                BLOB_CACHE.inc(result="memory")
+                return blob
+        content = self._load(sha)
+        if content is None:
+            BLOB_CACHE.inc(result="miss")
+            return None
+        BLOB_CACHE.inc(result="disk")
+        return self._parse(sha, content)
+
+    def put(self, sha, content):
+        """Parses `content` (whose blob sha is `sha`), stores and returns it."""
+        blob = self._parse(sha, content)
+        if self.max_bytes > 0:
+            self._save(sha, content)
+        return blob
+
+    def _parse(self, sha, content):
+        with PARSE_SECONDS.time(kind="csv"):
+            blob = Blob(content, csv_to_entries(content))
+        self._remember(sha, blob)
+        return blob
+
+    def _remember(self, sha, blob):
+        with self._lock:
+            self._items[sha] = blob
+            self._items.move_to_end(sha)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def _load(self, sha):
+        path = self._file(sha)
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                content = f.read()
+            if blob_sha(content) != sha:
+                os.remove(path)
+                return None
+            os.utime(path)  # marks it recently used for the trim
+            return content
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, sha, content):
+        path = self._file(sha)
+        tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(content)
+            os.replace(tmp, path)
+            self._trim()
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _cached_files(self):
+        """The cache's own files; anything else in the directory is left alone."""
+        return [e for e in os.scandir(self.directory) if _BLOB_FILE.match(e.name)]
+
+    def _trim(self):
+        files = []
+        for e in self._cached_files():
+            info = e.stat()
+            files.append((info.st_mtime, info.st_size, e.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._items)
+        try:
+            disk = [e.stat().st_size for e in self._cached_files()]
+        except OSError:
+            disk = []
+        return {"entries": entries, "max_entries": self.max_entries, "disk_files": len(disk),
+                "disk_bytes": sum(disk), "max_bytes": self.max_bytes, "directory": self.directory}
+
+
+_blobs = None
+
+
+def blob_cache():
+    """
+    The process's BlobCache, configured from:
+      BLOB_CACHE_DIR = "/var/cache/futo"   # default: futo_blob_cache in the temp directory
+      BLOB_CACHE_MB  = "64"                # disk bound; "0" keeps it in memory only
+    """
+    global _blobs
+    if _blobs is None:
+        with _backend_lock:
+            if _blobs is None:
+                _blobs = BlobCache(
+                    setting("BLOB_CACHE_DIR", "") or os.path.join(tempfile.gettempdir(), "futo_blob_cache"),
+                    int(float(setting("BLOB_CACHE_MB", 64)) * 1024 * 1024))
+    return _blobs
+
+
+# ─── Module-level API ─────────────────────────────────────────────────────────
+
+def read_file(path):
+    return get_backend().read_file(path)
+
+
+def write_file(path, content_str, message, sha=None):
+    return get_backend().write_file(path, content_str, message, sha)
+
+
+def read_tail(path, offset, version=None):
+    return get_backend().read_tail(path, offset, version)
+
+
+def append_file(path, content_str, message, sha=None):
+    return get_backend().append_file(path, content_str, message, sha)
+
+
+def read_json(path):
+    return get_backend().read_json(path)
+
+
+def write_json(path, data, message, sha=None):
+    return get_backend().write_json(path, data, message, sha)
+
+
+def list_files_in_dir(path_prefix):
+    return get_backend().list_files_in_dir(path_prefix)
+
+
+def list_blobs(path_prefix):
+    return get_backend().list_blobs(path_prefix)
+
+
+# ─── Attendance helpers ───────────────────────────────────────────────────────
+
+ACTIVE_PATH    = "active_attendances.json"
+PASSWORDS_PATH = "rep_passwords.json"
+
+_id_paths = None
+
+
+def _use_id_paths():
+    """STORAGE_PATHS = "ids" files cohorts under attendances/<cohort id> instead of their names."""
+    global _id_paths
+    if _id_paths is None:
+        _id_paths = str(setting("STORAGE_PATHS", "names")).strip().lower() == "ids"
+    return _id_paths
+
+
+def att_dir(school, dept, level):
+    c = cohort_for(school, dept, level)
+    if c is None:
+        return f"{ATTENDANCES_ROOT}/{safe_name(school)}/{safe_name(dept)}/{level}L"
+    return f"{ATTENDANCES_ROOT}/{c.id}" if _use_id_paths() else c.dir
+
+
+def att_key(school, dept, level):
+    c = cohort_for(school, dept, level)
+    return c.key if c else f"{school}||{dept}||{level}"
+
+
+def index_key(school, dept, level):
+    """Key of a cohort in active_attendances.json: its cohort ID when it has one."""
+    c = cohort_for(school, dept, level)
+    return str(c.id) if c else att_key(school, dept, level)
+
+
+def get_csv_path(school, dept, level, course_code, date_str, time_str):
+    safe_code = course_code.replace(" ", "_")
+    return f"{att_dir(school, dept, level)}/{safe_code}_{date_str}_{time_str}.csv"
+
+
+def get_devices_path(csv_path):
+    """Device list of sessions from before the log; read once when migrating them."""
+    return csv_path.replace(".csv", "_devices.json")
+
+
+def get_log_path(csv_path):
+    return csv_path.replace(".csv", "_log.jsonl")
+
+
+# ─── Session entries ──────────────────────────────────────────────────────────
+# The entry log is the single state document of a running session: entries
+# and device locks (see utils.parse_log). The CSV written at "Start
+# Attendance" holds only the header until finalize_csv() fills it in.
+
+def start_session_files(sess, **fields):
+    """
+    Creates the header-only CSV and empty log for a new session and lists it
+    in the manifest (with any extra manifest `fields`).
+    """
+    csv_path = sess["csv_path"]
+    with profiler.span("storage.start_session_files", csv_path=csv_path):
+        sha = write_file(csv_path, entries_to_csv([]), "Start attendance", None)
+        write_file(get_log_path(csv_path), "", "Start entry log", None)
+        record_session(csv_path, course_code=sess["course_code"], date=sess["date"],
+                       start_time=sess["start_time"], entries=0, sha=sha, status="active", **fields)
+
+
+PARSE_SECONDS = metrics.histogram("parse_seconds", "Parsing session logs and CSVs", ("kind",))
+
+
+@profiler.traced(arg="csv_path")
+def read_session(csv_path):
+    """
+    Returns (entries, devices, log_sha); devices is the set of hashed device
+    IDs that have signed. A session started before the log existed gets one
+    built from its CSV and _devices.json the first time it is read.
+    """
+    log_path = get_log_path(csv_path)
+    content, sha = read_file(log_path)
+    if content is not None:
+        with PARSE_SECONDS.time(kind="log"):
+            entries, devices = parse_log(content)
+        return entries, devices, sha
+    csv_content, _ = read_file(csv_path)
+    with PARSE_SECONDS.time(kind="csv"):
+        entries = csv_to_entries(csv_content) if csv_content else []
+    dev_content, _ = read_file(get_devices_path(csv_path))
+    try:
+        devices = {hash_device(d) for d in json.loads(dev_content)} if dev_content else set()
+    except ValueError:
+        devices = set()
+    if not entries and not devices:
+        return [], set(), None
+    try:
+        sha = write_file(log_path, entries_to_log(entries, devices), "Start entry log", None)
+    except ShaConflict:
+        return read_session(csv_path)
+    return entries, devices, sha
+
+
+def read_entries(csv_path):
+    """Returns (entries, log_sha)."""
+    entries, _, sha = read_session(csv_path)
+    return entries, sha
+
+
+def append_entries(csv_path, new_entries, message, sha=None):
+    """Appends to the log; with `sha` (from read_session) only if nothing else did first."""
+    return append_file(get_log_path(csv_path), entries_to_log(new_entries), message, sha)
+
+
+def write_entries(csv_path, entries, message, sha, devices=()):
+    """
+    Rewrites the whole log — for edits and deletes, not for new entries.
+    `devices` keeps locks whose entries are gone. `sha` is the log sha from
+    read_session(); a stale one raises ShaConflict.
+    """
+    return write_file(get_log_path(csv_path), entries_to_log(entries, devices), message, sha)
+
+
+POLL_BACKOFF = 5  # seconds, times the budget's poll_factor, between live-view polls once it runs low
+
+
+def poll_gap():
+    """Least seconds between background polls: 0 normally, more as the GitHub budget runs down."""
+    factor = github_storage.budget.poll_factor()
+    return 0 if factor == 1 else POLL_BACKOFF * factor
+
+
+class EntryFeed:
+    """
+    Incremental reader of one session's log, for a live view that polls.
+    poll() reads only the bytes past the last complete line it saw, and
+    nothing at all when the log's version is unchanged. A log that was
+    rewritten (an edit or delete) is detected by the last line seen no longer
+    sitting just before the cursor, and is then read from the start.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.path = get_log_path(csv_path)
+        self.entries, self.devices = [], set()
+        self.offset, self.last_line, self.version = 0, b"", None
+        self.polled_at = None
+
+    @profiler.traced("storage.EntryFeed.poll")
+    def poll(self, min_gap=0):
+        """
+        Reads what was added since the last poll. Returns (new_entries, reset).
+        Within `min_gap` seconds of the last poll it returns ([], False) unread.
+        """
+        now = time.monotonic()
+        if min_gap and self.polled_at is not None and now - self.polled_at < min_gap:
+            return [], False
+        self.polled_at = now
+        start = self.offset - len(self.last_line)
+        tail, version = read_tail(self.path, start, self.version)
+        if tail is None:
+            if self.offset == 0 and read_session(self.csv_path)[2]:
+                return self.poll()  # an older session's log was just built
+            return [], False
+        if version == self.version:
+            return [], False
+        # Bytes until only complete lines remain: a stale offset into a rewritten
+        # log can land inside a multi-byte character.
+        data = tail
+        reset = not data.startswith(self.last_line) or len(data) == len(self.last_line)
+        if reset and self.offset:
+            data, version = read_tail(self.path, 0)
+            data, start = data or b"", 0
+            self.entries, self.devices = [], set()
+        else:
+            reset, data, start = False, data[len(self.last_line):], self.offset
+        end = data.rfind(b"\n") + 1  # an append still being written waits for next poll
+        with PARSE_SECONDS.time(kind="log_tail"):
+            new, devices = parse_log(data[:end].decode("utf-8"))
+        if end:
+            self.last_line = data[data.rfind(b"\n", 0, end - 1) + 1:end]
+            self.offset = start + end
+        self.version = version if end == len(data) else None
+        self.entries += new
+        self.devices |= devices
+        return new, reset
+
+
+def read_blob(path, sha=None):
+    """
+    Blob (content and parsed entries) of a file that no longer changes, such
+    as an ended session's CSV, or None if it is missing. With the file's
+    `sha` (from the manifest or list_blobs) a cached copy needs no request.
+    """
+    cache = blob_cache()
+    blob = cache.get(sha) if sha else None
+    if blob is not None:
+        return blob
+    content, current = read_file(path)
+    if content is None:
+        return None
+    if current != sha:
+        blob = cache.get(current)  # already parsed under the sha it has now
+    return blob or cache.put(current, content)
+
+
+def read_session_blob(row):
+    """
+    Blob for a manifest row; a session still running is built from its log
+    (for a shared session, the cohort's entries in the shared log), uncached.
+    """
+    if row.get("status") == "active":
+        entries, _ = read_entries(row.get("store", row["path"]))
+        if "store" in row:
+            entries = cohort_entries(entries, row["cohort"], row["host"])
+        return Blob(entries_to_csv(entries), entries)
+    return read_blob(row["path"], row.get("sha"))
+
+
+def read_session_csv(row):
+    """CSV text for a manifest row."""
+    blob = read_session_blob(row)
+    return blob.content if blob else None
+
+
+@profiler.traced(arg="csv_path")
+def finalize_csv(csv_path, entries=None):
+    """
+    Writes the session CSV from its log (or from `entries`) and updates the
+    manifest. Returns the entry count.
+    """
+    if entries is None:
+        entries, _ = read_entries(csv_path)
+    _, sha = read_file(csv_path)
+    sha = write_file(csv_path, entries_to_csv(entries), "End attendance", sha)
+    record_session(csv_path, entries=len(entries), sha=sha, status="ended")
+    return len(entries)
+
+
+# ─── Manifests ────────────────────────────────────────────────────────────────
+# Each cohort folder has a _manifest.json listing its sessions (course code,
+# date, entry count, CSV blob sha), so the Download tab reads one small file
+# instead of the recursive tree of the whole data repo.
+
+JSON_UPDATE_ATTEMPTS = 3
+
+
+def update_json(path, change, message, attempts=JSON_UPDATE_ATTEMPTS):
+    """Read-modify-write of a JSON file: `change(data)` mutates it in place. Retries on ShaConflict."""
+    for attempt in range(attempts):
+        data, sha = read_json(path)
+        data = data or {}
+        change(data)
+        try:
+            return write_json(path, data, message, sha)
+        except ShaConflict:
+            if attempt == attempts - 1:
+                raise
+
+
+def get_manifest_path(school, dept, level):
+    return f"{att_dir(school, dept, level)}/_manifest.json"
+
+
+def parse_csv_name(csv_path):
+    """{"course_code", "date", "start_time"} from a get_csv_path() file name."""
+    code, date, start = csv_path.rsplit("/", 1)[-1][:-len(".csv")].rsplit("_", 2)
+    return {"course_code": code.replace("_", " "), "date": date, "start_time": start}
+
+
+def record_session(csv_path, **fields):
+    """Adds the session to its cohort manifest, or updates its row with `fields`."""
+    folder = csv_path.rsplit("/", 1)[0]
+
+    def change(data):
+        if "sessions" not in data:
+            # First manifest for this cohort: pick up sessions from older versions.
+            data["sessions"] = [dict(path=p, sha=sha, **parse_csv_name(p))
+                                for p, sha in list_blobs(folder + "/").items()
+                                if p.endswith(".csv") and p != csv_path]
+        rows = data["sessions"]
+        for row in rows:
+            if row["path"] == csv_path:
+                row.update(fields)
+                return
+        rows.append(dict(dict(path=csv_path, **parse_csv_name(csv_path)), **fields))
+    update_json(folder + "/_manifest.json", change, "Update session manifest")
+
+
+def session_closed(csv_path):
+    """True once the session's manifest row says it ended; sessions with no row count as open."""
+    data, _ = read_json(csv_path.rsplit("/", 1)[0] + "/_manifest.json")
+    for row in (data or {}).get("sessions", []):
+        if row["path"] == csv_path:
+            return row.get("status") == "ended"
+    return False
+
+
+@profiler.traced()
+def list_sessions(school, dept, level):
+    return get_backend().list_sessions(school, dept, level)
+
+
+# ─── Active sessions ──────────────────────────────────────────────────────────
+# Each cohort's running session lives in its own small file in its attendance
+# folder, so a student lookup reads one cohort and starting a session in one
+# department never conflicts with another. active_attendances.json is kept as
+# a best-effort index of all of them (for admins); nothing hot reads it.
+
+def get_active_path(school, dept, level):
+    return f"{att_dir(school, dept, level)}/_active.json"
+
+
+@profiler.traced()
+def get_active_session(school, dept, level):
+    """Returns (session_dict or None, sha) for the cohort."""
+    data, sha = read_json(get_active_path(school, dept, level))
+    return (data or None), sha
+
+
+def get_active_session_cached(school, dept, level):
+    """
+    The cohort's running session (or None) for pages that only read it. Shared
+    by every session in the process and at most ACTIVE_TTL seconds old, so
+    Streamlit reruns do not each cost a storage read; starts and ends made in
+    this process show up at once.
+    """
+    return _active.get(att_key(school, dept, level),
+                       lambda: get_active_session(school, dept, level)[0])
+
+
+def set_active_session(school, dept, level, sess, sha=None):
+    """Stores the cohort's running session; `sess=None` ends it."""
+    new_sha = write_json(get_active_path(school, dept, level), sess or {},
+                         "Start attendance" if sess else "End attendance", sha)
+    _active.put(att_key(school, dept, level), sess or None)
+    if str(setting("ACTIVE_INDEX", "1")) != "0":
+        _update_active_index(school, dept, level, sess)
+    return new_sha
+
+
+def _update_active_index(school, dept, level, sess):
+    key = index_key(school, dept, level)
+
+    def change(data):
+        if sess:
+            data[key] = {k: sess[k] for k in ("cohort", "cohorts", "course_code", "started_at", "csv_path")
+                         if k in sess}
+        else:
+            data.pop(key, None)
+    try:
+        update_json(ACTIVE_PATH, change, "Update active attendances")
+    except (ShaConflict, requests.RequestException) as exc:
+        # The cohort file is already written; the index can catch up next time
+        log.warning("Could not update %s for %s: %s", ACTIVE_PATH, key, exc)
+
+
+def migrate_active_registry():
+    """One-off: copies sessions from the old global registry into cohort files."""
+    data, _ = get_active_attendances()
+    data = {k: v for k, v in data.items() if "school" in v}  # old-style rows only
+    for sess in data.values():
+        current, sha = get_active_session(sess["school"], sess["dept"], sess["level"])
+        if current is None:
+            write_json(get_active_path(sess["school"], sess["dept"], sess["level"]), sess,
+                       "Start attendance", sha)
+    return len(data)
+
+
+# ─── Shared sessions ──────────────────────────────────────────────────────────
+# One lecture for several cohorts (a general course such as CHM 101): one
+# code, one log and one write stream instead of a session per cohort. The
+# host cohort's CSV path names the shared log, and every cohort's _active.json
+# holds the same session with "cohorts" listing their ids, the host's first.
+# Entries carry the signer's cohort id; untagged ones are the host's. Ending
+# the session splits the log into each cohort's own CSV.
+
+def session_cohorts(sess):
+    """[(cohort_id, school, dept, level)] of every cohort in the session, the host's first."""
+    host = [(sess.get("cohort"), sess["school"], sess["dept"], sess["level"])]
+    guests = [get_cohort(cid) for cid in sess.get("cohorts", [])[1:]]
+    return host + [(c.id, c.school, c.dept, c.level) for c in guests if c is not None]
+
+
+def cohort_entries(entries, cohort_id, host_id):
+    """The entries of one cohort in a shared session's log."""
+    return [e for e in entries if e.get("cohort", host_id) == cohort_id]
+
+
+@profiler.traced()
+def start_session(sess, guests=()):
+    """
+    Opens `sess` for its own cohort and, as a shared session, for the `guests`
+    Cohorts too. Returns the (school, dept, level) of every cohort that already
+    has a session running, in which case nothing is started.
+
+    Every cohort's _active.json is claimed (against the sha it was read at)
+    before any session file is written. A cohort that started a session in
+    between raises ShaConflict; the claims already made are then undone and
+    that cohort is reported busy, so nothing is left half started.
+    """
+    cohorts = [(sess["school"], sess["dept"], sess["level"])] + [(c.school, c.dept, c.level) for c in guests]
+    current = [(names, *get_active_session(*names)) for names in cohorts]
+    busy = [names for names, running, _ in current if running is not None]
+    if busy:
+        return busy
+    if guests:
+        sess["cohorts"] = [sess["cohort"]] + [c.id for c in guests]
+
+    claimed = []
+    for names, _, sha in current:
+        try:
+            claimed.append((names, set_active_session(*names, sess, sha)))
+        except ShaConflict:
+            for done, new_sha in claimed:
+                try:
+                    set_active_session(*done, None, new_sha)
+                except ShaConflict:
+                    pass  # changed again since; not ours to clear
+            sess.pop("cohorts", None)
+            return [names]
+
+    if not guests:
+        start_session_files(sess)
+        return []
+    shared = dict(store=sess["csv_path"], host=sess["cohort"])
+    start_session_files(sess, cohort=sess["cohort"], **shared)
+    for c in guests:
+        csv_path = get_csv_path(c.school, c.dept, c.level, sess["course_code"], sess["date"], sess["start_time"])
+        sha = write_file(csv_path, entries_to_csv([]), "Start attendance", None)
+        record_session(csv_path, course_code=sess["course_code"], date=sess["date"],
+                       start_time=sess["start_time"], entries=0, sha=sha, status="active",
+                       cohort=c.id, **shared)
+    return []
+
+
+@profiler.traced()
+def end_session(sess):
+    """
+    Writes the session's CSV (one per cohort for a shared session) and closes
+    it for every cohort still showing it. Returns {cohort_id: entry count}.
+    Submissions still queued in this process are written first; later ones
+    are refused (see submissions.closing).
+    """
+    import submissions  # imports this module
+    store, host = sess["csv_path"], sess.get("cohort")
+    cohorts = session_cohorts(sess)
+    with submissions.closing(store):
+        if len(cohorts) == 1:
+            counts = {host: finalize_csv(store)}
+        else:
+            entries, _ = read_entries(store)
+            counts = {}
+            for cid, school, dept, level in cohorts:
+                path = store if cid == host else get_csv_path(school, dept, level, sess["course_code"],
+                                                              sess["date"], sess["start_time"])
+                counts[cid] = finalize_csv(path, cohort_entries(entries, cid, host))
+        for _, school, dept, level in cohorts:
+            current, sha = get_active_session(school, dept, level)
+            if current and current.get("csv_path") == store:
+                set_active_session(school, dept, level, None, sha)
+    return counts
+
+
+def get_active_attendances():
+    return get_backend().get_active_attendances()
+
+
+def set_active_attendances(data, sha=None):
+    return get_backend().set_active_attendances(data, sha)
+
+
+def list_attendance_csvs(school, dept, level):
+    return get_backend().list_attendance_csvs(school, dept, level)
+
+
+def get_custom_passwords():
+    """
+    Shared by every session in the process and re-validated every
+    PASSWORDS_TTL seconds (a 304 on GitHub when nothing changed), so a login
+    click normally makes no storage call.
+    """
+    data, sha = _passwords.get(PASSWORDS_PATH, get_backend().get_custom_passwords)
+    return dict(data), sha
+
+
+def set_custom_passwords(data, sha=None):
+    try:
+        return get_backend().set_custom_passwords(data, sha)
+    finally:
+        _passwords.invalidate(PASSWORDS_PATH)
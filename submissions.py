@@ -0,0 +1,408 @@
+"""
+Write-behind queue for student submissions.
+
+At lecture start hundreds of students submit within a few code slots.
+Instead of one commit per student, submissions for the same session are
+held for FLUSH_WINDOW seconds and then written together as one append to
+the session log, which carries both the entries and their device locks.
+Batches are written by a bounded pool of SUBMIT_WORKERS threads. Each
+submitter gets a Future that resolves to one of the RESULT_* values
+below, or a receipt whose status the page can look up on later reruns.
+"""
+
+import time
+import uuid
+import random
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils import DedupeIndex, hash_device
+import metrics
+import profiler
+import storage
+
+
+FLUSH_WINDOW   = 1.5   # seconds a batch stays open after its first submission
+SUBMIT_WORKERS = 4     # threads writing batches; more sessions than this wait their turn
+RECEIPTS_MAX   = 5000  # receipts remembered for status lookups, oldest dropped first
+LATENCY_SAMPLES = 1000 # recent submit-to-result times kept for queue_stats()
+
+RESULT_OK         = "ok"
+RESULT_DUP_NAME   = "dup_name"
+RESULT_DUP_MATRIC = "dup_matric"
+RESULT_DEVICE     = "device_used"
+RESULT_MISSING    = "missing"
+RESULT_CLOSED     = "closed"     # the session ended before the write
+
+SUBMISSIONS    = metrics.counter("submissions_total", "Queued submissions by outcome", ("result",))
+SUBMIT_SECONDS = metrics.histogram("submission_seconds", "Submit to recorded (or rejected)")
+BATCH_SIZE     = metrics.histogram("submission_batch_size", "Submissions per log append",
+                                   buckets=metrics.SIZE_BUCKETS)
+WRITE_SECONDS  = metrics.histogram("submission_write_seconds", "One session write, conflict retries included",
+                                   ("kind",))
+WRITE_CONFLICTS = metrics.counter("submission_conflicts_total", "Session writes retried after a ShaConflict")
+QUEUE_DEPTH    = metrics.gauge("submission_queue_depth", "Submission queue right now", ("state",))
+
+STATUS_PENDING   = "pending"    # queued or being written
+STATUS_CONFIRMED = "confirmed"  # written; the result is one of RESULT_*
+STATUS_FAILED    = "failed"     # the write raised; nothing was recorded
+STATUS_UNKNOWN   = "unknown"    # not a receipt this process knows (e.g. after a restart)
+
+
+class Submission:
+    def __init__(self, entry, device_id):
+        self.entry = entry
+        self.device = hash_device(device_id) if device_id else None
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+DEVICES_TTL = 10  # seconds; flushes in this process update the set straight away
+
+_devices = storage.TTLCache(DEVICES_TTL)
+
+
+def device_signed(csv_path, device_id):
+    """Page-load check from a process-wide cache; the write re-checks against the log."""
+    devices = _devices.get(csv_path, lambda: storage.read_session(csv_path)[1])
+    return hash_device(device_id) in devices
+
+
+# ─── Conflict retries ─────────────────────────────────────────────────────────
+# Writes carry the sha they were computed from. When another writer got there
+# first (ShaConflict) the step is re-run from a fresh read — duplicates are
+# re-checked against the latest entries — up to MAX_WRITE_ATTEMPTS times.
+
+MAX_WRITE_ATTEMPTS = 5
+RETRY_JITTER = 0.1  # seconds, times the attempt number
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(csv_path, conflicts, retry_secs, failed=False):
+    with _stats_lock:
+        s = _stats.setdefault(csv_path, {
+            "writes": 0, "conflicts": 0, "retried_writes": 0, "failed_writes": 0,
+            "retry_seconds_total": 0.0, "retry_seconds_max": 0.0,
+        })
+        s["writes"] += 1
+        s["conflicts"] += conflicts
+        if failed:
+            s["failed_writes"] += 1
+        if conflicts:
+            s["retried_writes"] += 1
+            s["retry_seconds_total"] += retry_secs
+            s["retry_seconds_max"] = max(s["retry_seconds_max"], retry_secs)
+
+
+def write_stats(csv_path=None):
+    """Conflict counters for one session, or {csv_path: counters} for all."""
+    with _stats_lock:
+        if csv_path is not None:
+            return dict(_stats.get(csv_path, {}))
+        return {path: dict(s) for path, s in _stats.items()}
+
+
+def with_retries(csv_path, step):
+    """Runs step() until it completes without a ShaConflict, within the budget."""
+    start = time.monotonic()
+    for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+        try:
+            result = step()
+        except storage.ShaConflict:
+            WRITE_CONFLICTS.inc()
+            if attempt == MAX_WRITE_ATTEMPTS:
+                _record(csv_path, attempt, time.monotonic() - start, failed=True)
+                raise
+            time.sleep(random.uniform(0, RETRY_JITTER * attempt))
+            continue
+        _record(csv_path, attempt - 1, time.monotonic() - start)
+        return result
+
+
+# ─── Dedupe index ─────────────────────────────────────────────────────────────
+# One DedupeIndex per session, shared by every writer in this process. The log
+# only grows between rewrites, so bringing the index up to date means adding
+# the entries past the last count it saw. Rewrites made here (update_entry)
+# adjust it in place; a log that got shorter is re-indexed from scratch.
+
+_indexes = {}        # csv_path -> (entry_count, DedupeIndex)
+_session_locks = {}  # csv_path -> RLock; one writer per session in this process
+_index_lock = threading.Lock()
+
+
+def _session_lock(csv_path):
+    with _index_lock:
+        return _session_locks.setdefault(csv_path, threading.RLock())
+
+
+def session_index(csv_path, entries):
+    """The session's DedupeIndex, brought up to date with `entries` (the latest log)."""
+    with _index_lock:
+        count, index = _indexes.get(csv_path, (0, None))
+        if index is None or count > len(entries):
+            count, index = 0, DedupeIndex()
+        for e in entries[count:]:
+            index.add(e)
+        _indexes[csv_path] = (len(entries), index)
+        return index
+
+
+def _set_count(csv_path, index, count):
+    with _index_lock:
+        _indexes[csv_path] = (count, index)
+
+
+def precheck(csv_path, entry):
+    """
+    Duplicate check against the last index built for the session, with no
+    storage calls. RESULT_OK here is provisional; the write checks again.
+    """
+    with _index_lock:
+        index = _indexes.get(csv_path, (0, None))[1]
+        if index is None:
+            return RESULT_OK
+        if index.has_name(entry["surname"], entry["first_name"], entry["middle_name"], cohort=entry.get("cohort")):
+            return RESULT_DUP_NAME
+        if index.has_matric(entry["matric"]):
+            return RESULT_DUP_MATRIC
+    return RESULT_OK
+
+
+# ─── Writes ───────────────────────────────────────────────────────────────────
+
+def _append_batch(csv_path, batch):
+    if storage.session_closed(csv_path):
+        return [RESULT_CLOSED] * len(batch)
+    entries, devices, log_sha = storage.read_session(csv_path)
+    index = session_index(csv_path, entries)
+    in_batch = DedupeIndex()
+
+    results, added = [], []
+    for sub in batch:
+        e = sub.entry
+        if sub.device and sub.device in devices:
+            results.append(RESULT_DEVICE)
+        elif (index.has_name(e["surname"], e["first_name"], e["middle_name"], cohort=e.get("cohort"))
+              or in_batch.has_name(e["surname"], e["first_name"], e["middle_name"], cohort=e.get("cohort"))):
+            results.append(RESULT_DUP_NAME)
+        elif index.has_matric(e["matric"]) or in_batch.has_matric(e["matric"]):
+            results.append(RESULT_DUP_MATRIC)
+        else:
+            if sub.device:
+                e = dict(e, device=sub.device)
+                devices.add(sub.device)
+            in_batch.add(e)
+            added.append(e)
+            results.append(RESULT_OK)
+
+    if added:
+        msg = "Add student entry" if len(added) == 1 else f"Add {len(added)} student entries"
+        storage.append_entries(csv_path, added, msg, log_sha)
+        _devices.put(csv_path, devices)
+        # Past the stored count only, under the lock: a page may have indexed these lines already
+        session_index(csv_path, entries + added)
+    return results
+
+
+@profiler.traced(arg="csv_path")
+def write_batch(csv_path, batch):
+    """
+    Applies a batch of submissions to the session with one log append.
+    Returns the RESULT_* value for each submission, in order. Duplicates and
+    device locks are checked against the log and earlier ones in the batch.
+    """
+    BATCH_SIZE.observe(len(batch))
+    with WRITE_SECONDS.time(kind="append"), _session_lock(csv_path):
+        return with_retries(csv_path, lambda: _append_batch(csv_path, batch))
+
+
+def add_entry(csv_path, entry):
+    """A rep's manual add: same duplicate rules, no device. Returns a RESULT_* value."""
+    return write_batch(csv_path, [Submission(entry, None)])[0]
+
+
+@profiler.traced(arg="csv_path")
+def update_entry(csv_path, old, new):
+    """
+    Replaces `old` with `new` (or deletes it when `new` is None) in the latest
+    log; the device lock and cohort tag of `old` stay either way. Returns a
+    RESULT_* value; RESULT_MISSING if `old` is no longer there.
+    """
+    def step():
+        entries, devices, log_sha = storage.read_session(csv_path)
+        if old not in entries:
+            return RESULT_MISSING
+        index = session_index(csv_path, entries)
+        if new is None:
+            entries.remove(old)
+            storage.write_entries(csv_path, entries, "Delete attendance entry", log_sha, devices)
+            index.remove(old)
+            _set_count(csv_path, index, len(entries))
+            return RESULT_OK
+        if index.has_name(new["surname"], new["first_name"], new["middle_name"], ignore=old,
+                          cohort=new.get("cohort")):
+            return RESULT_DUP_NAME
+        if index.has_matric(new["matric"], ignore=old):
+            return RESULT_DUP_MATRIC
+        updated = dict(new, **{k: old[k] for k in ("device", "cohort") if k in old and k not in new})
+        entries[entries.index(old)] = updated
+        storage.write_entries(csv_path, entries, "Update attendance entry", log_sha, devices)
+        index.remove(old)
+        index.add(updated)
+        return RESULT_OK
+    with WRITE_SECONDS.time(kind="rewrite"), _session_lock(csv_path):
+        return with_retries(csv_path, step)
+
+
+class CommitQueue:
+    """
+    Per-session batches, each handed to the worker pool FLUSH_WINDOW after it
+    opens. Counts what is waiting and how long submissions take to resolve.
+    """
+
+    def __init__(self, window=FLUSH_WINDOW, workers=SUBMIT_WORKERS):
+        self.window = window
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="submit")
+        self._pending = {}  # csv_path -> [Submission]
+        self._receipts = OrderedDict()  # receipt -> Future
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counts = {"submitted": 0, "confirmed": 0, "failed": 0, "batches_queued": 0, "batches_running": 0}
+        self._lock = threading.Lock()
+
+    def submit(self, csv_path, entry, device_id):
+        sub = Submission(entry, device_id)
+        with self._lock:
+            batch = self._pending.setdefault(csv_path, [])
+            batch.append(sub)
+            opened = len(batch) == 1
+            self._counts["submitted"] += 1
+            self._update_gauges()
+        if opened:
+            timer = threading.Timer(self.window, self._schedule, args=(csv_path,))
+            timer.daemon = True
+            timer.start()
+        return sub.future
+
+    def enqueue(self, csv_path, entry, device_id):
+        """Like submit() but returns a receipt for status(), without waiting."""
+        future = self.submit(csv_path, entry, device_id)
+        receipt = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._receipts[receipt] = future
+            while len(self._receipts) > RECEIPTS_MAX:
+                self._receipts.popitem(last=False)
+        return receipt
+
+    def status(self, receipt):
+        """Returns (STATUS_*, RESULT_* or None) for a receipt from enqueue()."""
+        with self._lock:
+            future = self._receipts.get(receipt)
+        if future is None:
+            return STATUS_UNKNOWN, None
+        if not future.done():
+            return STATUS_PENDING, None
+        if future.exception() is not None:
+            return STATUS_FAILED, None
+        return STATUS_CONFIRMED, future.result()
+
+    def _schedule(self, csv_path):
+        with self._lock:
+            self._counts["batches_queued"] += 1
+            self._update_gauges()
+        self._pool.submit(self.flush, csv_path)
+
+    def flush(self, csv_path, scheduled=True):
+        """Writes the session's open batch; `scheduled` is False when called outside the timer."""
+        with self._lock:
+            batch = self._pending.pop(csv_path, [])
+            if scheduled:
+                self._counts["batches_queued"] = max(0, self._counts["batches_queued"] - 1)
+            self._counts["batches_running"] += 1
+            self._update_gauges()
+        try:
+            if not batch:
+                return
+            try:
+                results = write_batch(csv_path, batch)
+            except Exception as exc:
+                self._finish(batch, "failed")
+                for sub in batch:
+                    sub.future.set_exception(exc)
+                return
+            self._finish(batch, "confirmed", results)
+            for sub, result in zip(batch, results):
+                sub.future.set_result(result)
+        finally:
+            with self._lock:
+                self._counts["batches_running"] -= 1
+                self._update_gauges()
+
+    def _finish(self, batch, outcome, results=None):
+        now = time.monotonic()
+        for sub, result in zip(batch, results or ["failed"] * len(batch)):
+            SUBMISSIONS.inc(result=result)
+            SUBMIT_SECONDS.observe(now - sub.queued_at)
+        with self._lock:
+            self._counts[outcome] += len(batch)
+            self._latencies.extend(now - sub.queued_at for sub in batch)
+
+    def _update_gauges(self):
+        # Called with self._lock held
+        QUEUE_DEPTH.set(sum(len(b) for b in self._pending.values()), state="waiting")
+        QUEUE_DEPTH.set(self._counts["batches_queued"], state="batches_queued")
+        QUEUE_DEPTH.set(self._counts["batches_running"], state="batches_running")
+
+    def stats(self):
+        """Queue depth and recent submit-to-result latency, in seconds."""
+        with self._lock:
+            out = dict(self._counts)
+            out["waiting"] = sum(len(b) for b in self._pending.values())
+            out["workers"] = self.workers
+            samples = sorted(self._latencies)
+        for name, q in (("latency_p50", 0.50), ("latency_p95", 0.95)):
+            out[name] = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+        out["latency_max"] = samples[-1] if samples else 0.0
+        return out
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The process-wide queue shared by every Student Recorder session."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = CommitQueue()
+    return _queue
+
+
+def set_queue(queue):
+    """Replaces the process-wide queue (benchmarks tune window and workers this way)."""
+    global _queue
+    with _queue_lock:
+        _queue = queue
+
+
+def queue_stats():
+    """stats() of the process-wide queue."""
+    return get_queue().stats()
+
+
+@contextmanager
+def closing(csv_path):
+    """
+    Holds the session's write lock with its open batch already written, so a
+    session can be ended without losing submissions still in the flush window.
+    Writes that wait on the lock find the session ended and get RESULT_CLOSED.
+    """
+    with _session_lock(csv_path):
+        get_queue().flush(csv_path, scheduled=False)
+        yield
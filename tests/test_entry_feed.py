@@ -0,0 +1,78 @@
+"""EntryFeed against logs rewritten under it, with names outside ASCII."""
+
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from utils import entries_to_log, parse_log
+
+CSV_PATH = "attendances/Test/Dept/100L/ABC_101_2025-01-01_09-00-00.csv"
+LOG_PATH = storage.get_log_path(CSV_PATH)
+NAMES = ["ỌKỌNKWỌ", "ÉZÈ", "NWÁNỌ̀DÌ", "OBI", "ADÉBÁYỌ̀", "IFEANYI", "Ọ" * 9]
+
+
+@pytest.fixture(params=["memory", "local"])
+def backend(request, tmp_path):
+    previous = storage._backend
+    storage.set_backend(storage.MemoryBackend() if request.param == "memory"
+                        else storage.LocalBackend(str(tmp_path)))
+    yield storage.get_backend()
+    storage.set_backend(previous)
+
+
+def entry(surname, n):
+    return {"surname": surname, "first_name": "ADA", "middle_name": "",
+            "matric": f"2021/{n:05d}", "timestamp": "2025-01-01 09:00:00"}
+
+
+def rewrite(entries):
+    _, sha = storage.read_file(LOG_PATH)
+    storage.write_file(LOG_PATH, entries_to_log(entries), "rewrite", sha)
+
+
+def current_entries():
+    return parse_log(storage.read_file(LOG_PATH)[0])[0]
+
+
+def test_rewrite_that_puts_the_cursor_inside_a_character(backend):
+    first, second = entry("OBI", 1), entry("EZE", 2)
+    storage.write_file(LOG_PATH, entries_to_log([first, second]), "start", None)
+    feed = storage.EntryFeed(CSV_PATH)
+    feed.poll()
+    cursor = len(entries_to_log([first]).encode("utf-8"))  # where the next poll starts reading
+
+    # An edit that leaves a multi-byte character straddling the cursor
+    edited = next(e for e in ([entry("Ọ" * n, 1), second] for n in range(1, 100))
+                  if entries_to_log(e).encode("utf-8")[cursor] & 0xC0 == 0x80)
+    rewrite(edited)
+
+    new, reset = feed.poll()
+    assert reset
+    assert feed.entries == edited
+
+
+def test_poll_follows_appends_and_rewrites(backend):
+    rng = random.Random(7)
+    storage.write_file(LOG_PATH, entries_to_log([entry(rng.choice(NAMES), n) for n in range(5)]), "start", None)
+    feed = storage.EntryFeed(CSV_PATH)
+    serial = 5
+    for _ in range(200):
+        if rng.random() < 0.5:
+            new = [entry(rng.choice(NAMES), serial + i) for i in range(rng.randint(1, 3))]
+            serial += len(new)
+            storage.append_file(LOG_PATH, entries_to_log(new), "append")
+        else:  # another tab edits or deletes an entry
+            entries = current_entries()
+            if entries:
+                entries.pop(rng.randrange(len(entries)))
+                for e in entries:
+                    if rng.random() < 0.3:
+                        e["surname"] = rng.choice(NAMES)
+            rewrite(entries)
+        feed.poll()
+        assert feed.entries == current_entries()
@@ -0,0 +1,117 @@
+"""The write-behind queue, duplicate checks and shared sessions, on the memory backend."""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+import submissions
+from futo_data import cohort_for
+
+SICT = "School of Information and Communication Technology (SICT)"
+HOST = cohort_for(SICT, "Computer Science", "300")
+GUEST = cohort_for(SICT, "Cyber Security", "300")
+
+
+@pytest.fixture(autouse=True)
+def backend(monkeypatch):
+    previous = storage._backend
+    storage.set_backend(storage.MemoryBackend())
+    monkeypatch.setattr(storage, "_active", storage.TTLCache(storage.ACTIVE_TTL))
+    monkeypatch.setattr(submissions, "_devices", storage.TTLCache(submissions.DEVICES_TTL))
+    monkeypatch.setattr(submissions, "_indexes", {})
+    yield storage.get_backend()
+    storage.set_backend(previous)
+    submissions.set_queue(None)
+
+
+@pytest.fixture
+def queue():
+    q = submissions.CommitQueue(window=0.5, workers=2)
+    submissions.set_queue(q)
+    return q
+
+
+def start(guests=()):
+    date, start_time = "2025-01-01", "09-00-00"
+    sess = {"cohort": HOST.id, "school": HOST.school, "dept": HOST.dept, "level": HOST.level,
+            "course_code": "CHM 101", "started_at": time.time(), "date": date, "start_time": start_time,
+            "csv_path": storage.get_csv_path(HOST.school, HOST.dept, HOST.level, "CHM 101", date, start_time)}
+    assert storage.start_session(sess, guests) == []
+    return sess
+
+
+def entry(surname, matric, cohort=None):
+    e = {"surname": surname, "first_name": "ADA", "middle_name": "", "matric": matric,
+         "timestamp": "2025-01-01 09:00:00"}
+    if cohort is not None:
+        e["cohort"] = cohort.id
+    return e
+
+
+def csv_entries(path):
+    return storage.csv_to_entries(storage.read_file(path)[0])
+
+
+def test_end_writes_the_batch_still_in_the_flush_window(queue):
+    sess = start()
+    future = queue.submit(sess["csv_path"], entry("OBI", "2021/1"), "device-1")
+    storage.end_session(sess)
+    assert future.result(timeout=5) == submissions.RESULT_OK
+    assert [e["matric"] for e in csv_entries(sess["csv_path"])] == ["2021/1"]
+    row, = storage.list_sessions(HOST.school, HOST.dept, HOST.level)
+    assert (row["status"], row["entries"]) == ("ended", 1)
+
+
+def test_submissions_after_the_end_are_refused(queue):
+    sess = start()
+    storage.end_session(sess)
+    future = queue.submit(sess["csv_path"], entry("OBI", "2021/1"), "device-1")
+    assert future.result(timeout=5) == submissions.RESULT_CLOSED
+    assert submissions.add_entry(sess["csv_path"], entry("EZE", "2021/2")) == submissions.RESULT_CLOSED
+    assert storage.read_entries(sess["csv_path"])[0] == []
+
+
+def test_batch_checks_duplicates_and_devices():
+    sess = start()
+    batch = [submissions.Submission(entry("OBI", "2021/1"), "device-1"),
+             submissions.Submission(entry("obi ", "2021/2"), "device-2"),
+             submissions.Submission(entry("EZE", "2021/1"), "device-3"),
+             submissions.Submission(entry("NWA", "2021/4"), "device-1"),
+             submissions.Submission(entry("ADE", "2021/5"), None)]
+    assert submissions.write_batch(sess["csv_path"], batch) == [
+        submissions.RESULT_OK, submissions.RESULT_DUP_NAME, submissions.RESULT_DUP_MATRIC,
+        submissions.RESULT_DEVICE, submissions.RESULT_OK]
+    assert submissions.add_entry(sess["csv_path"], entry("OBI", "2021/9")) == submissions.RESULT_DUP_NAME
+    assert submissions.device_signed(sess["csv_path"], "device-1")
+    assert not submissions.device_signed(sess["csv_path"], "device-2")
+
+
+def test_shared_session_names_are_per_cohort(queue):
+    sess = start([GUEST])
+    path = sess["csv_path"]
+    futures = [queue.submit(path, entry("OBI", "2021/1", HOST), "device-1"),
+               queue.submit(path, entry("OBI", "2021/2", GUEST), "device-2"),
+               queue.submit(path, entry("OBI", "2021/3", GUEST), "device-3"),
+               queue.submit(path, entry("EZE", "2021/1", GUEST), "device-4")]
+    assert [f.result(timeout=5) for f in futures] == [
+        submissions.RESULT_OK, submissions.RESULT_OK, submissions.RESULT_DUP_NAME, submissions.RESULT_DUP_MATRIC]
+    assert storage.end_session(sess) == {HOST.id: 1, GUEST.id: 1}
+    guest_path = storage.get_csv_path(GUEST.school, GUEST.dept, GUEST.level, "CHM 101",
+                                      sess["date"], sess["start_time"])
+    assert [e["matric"] for e in csv_entries(guest_path)] == ["2021/2"]
+    assert storage.get_active_session(GUEST.school, GUEST.dept, GUEST.level)[0] is None
+
+
+def test_ending_a_session_with_no_manifest_row_names_it():
+    sess = start()
+    manifest = storage.get_manifest_path(HOST.school, HOST.dept, HOST.level)
+    storage.write_json(manifest, {"sessions": []}, "started before manifests", storage.read_json(manifest)[1])
+    storage.end_session(sess)
+    row, = storage.list_sessions(HOST.school, HOST.dept, HOST.level)
+    assert row == dict(row, path=sess["csv_path"], course_code="CHM 101", date=sess["date"],
+                       start_time=sess["start_time"], entries=0, status="ended")
@@ -5,8 +5,12 @@ import random
 import time
 import io
 import csv
+import json
+from collections import Counter
 from datetime import datetime
 
+import profiler
+
 
 # ─── Password ─────────────────────────────────────────────────────────────────
 
@@ -20,17 +24,18 @@ def default_password(dept: str, level: str) -> str:
     abbr = dept.replace(" ", "")[:3].upper()
     return f"{abbr}{level}"
 
-def verify_rep_login(school, dept, level, password, custom_hashes: dict) -> bool:
-    key = f"{school}|{dept}|{level}"
-    if key in custom_hashes:
-        return verify_password(password, custom_hashes[key])
-    return verify_password(password, hash_password(default_password(dept, level)))
+def verify_rep_login(cohort, password, custom_hashes: dict) -> bool:
+    """`cohort` is the futo_data.Cohort; custom hashes are keyed by its password_key."""
+    if cohort.password_key in custom_hashes:
+        return verify_password(password, custom_hashes[cohort.password_key])
+    return verify_password(password, hash_password(default_password(cohort.dept, cohort.level)))
 
 
 # ─── Code generation ──────────────────────────────────────────────────────────
 
 INTERVAL = 10  # seconds per code slot
 
+@profiler.traced()
 def get_current_code(started_at: float):
     """
     Returns (code_str, slot_index, seconds_remaining_float).
@@ -43,6 +48,7 @@ def get_current_code(started_at: float):
     secs_left = INTERVAL - (elapsed % INTERVAL)
     return code, slot, secs_left
 
+@profiler.traced()
 def is_code_valid(entered: str, started_at: float) -> bool:
     current, _, _ = get_current_code(started_at)
     return entered.strip() == current
@@ -52,6 +58,7 @@ def is_code_valid(entered: str, started_at: float) -> bool:
 
 HEADERS = ["S/N", "Surname", "First Name", "Middle Name", "Matric Number", "Timestamp"]
 
+@profiler.traced()
 def entries_to_csv(entries: list) -> str:
     out = io.StringIO()
     w = csv.writer(out)
@@ -61,6 +68,7 @@ def entries_to_csv(entries: list) -> str:
                     e.get("middle_name",""), e.get("matric",""), e.get("timestamp","")])
     return out.getvalue()
 
+@profiler.traced()
 def csv_to_entries(csv_str: str) -> list:
     reader = csv.DictReader(io.StringIO(csv_str))
     return [{
@@ -71,16 +79,100 @@ def csv_to_entries(csv_str: str) -> list:
         "timestamp":  row.get("Timestamp", ""),
     } for row in reader]
 
+# ─── Entry log ────────────────────────────────────────────────────────────────
+# A session's state lives in one append-only JSON-lines log. Each student
+# line is an entry plus the hash of the device it came from, so the entry and
+# the device lock land in the same write. A line holding only "device" keeps
+# a device locked after the rep deletes its entry. The CSV (HEADERS layout)
+# is produced from the log when the session ends.
+
+def hash_device(device_id: str) -> str:
+    return hashlib.sha256(f"futo-device:{device_id}".encode()).hexdigest()[:16]
+
+def entries_to_log(entries: list, devices=()) -> str:
+    """Entry lines, then a lock line for each device not already on an entry."""
+    lines = [json.dumps(e, ensure_ascii=False) for e in entries]
+    on_entries = {e.get("device") for e in entries}
+    lines += [json.dumps({"device": d}) for d in sorted(devices) if d not in on_entries]
+    return "".join(line + "\n" for line in lines)
+
+@profiler.traced()
+def parse_log(log_str: str):
+    """Returns (entries, devices) where devices is the set of locked device hashes."""
+    entries, devices = [], set()
+    for line in log_str.splitlines():
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        if rec.get("device"):
+            devices.add(rec["device"])
+        if "matric" in rec:
+            entries.append(rec)
+    return entries, devices
+
+def name_key(surname, first, middle):
+    return surname.strip().upper() + first.strip().upper() + middle.strip().upper()
+
+def matric_key(matric):
+    return matric.strip().upper()
+
 def is_dup_name(surname, first, middle, entries):
-    key = (surname.strip().upper() + first.strip().upper() + middle.strip().upper())
-    for e in entries:
-        if (e["surname"].upper() + e["first_name"].upper() + e["middle_name"].upper()) == key:
-            return True
-    return False
+    key = name_key(surname, first, middle)
+    return any(name_key(e["surname"], e["first_name"], e["middle_name"]) == key for e in entries)
 
 def is_dup_matric(matric, entries):
-    m = matric.strip().upper()
-    return any(e["matric"].strip().upper() == m for e in entries)
+    m = matric_key(matric)
+    return any(matric_key(e["matric"]) == m for e in entries)
+
+
+class DedupeIndex:
+    """
+    Name and matric keys of a session's entries, for O(1) duplicate checks.
+    Build it once from the loaded entries and keep it in step with add/remove.
+    Keys are counted rather than just stored, so removing one of two entries
+    that share a key (possible after an edit) leaves the other in place.
+    In a shared session names are keyed by the entry's cohort tag, so two
+    departments may each have a student of the same name; matrics stay global.
+    """
+
+    def __init__(self, entries=()):
+        self.names = Counter()
+        self.matrics = Counter()
+        for e in entries:
+            self.add(e)
+
+    def __len__(self):
+        return sum(self.matrics.values())
+
+    @staticmethod
+    def _name(e):
+        return e.get("cohort"), name_key(e["surname"], e["first_name"], e["middle_name"])
+
+    def add(self, e):
+        self.names[self._name(e)] += 1
+        self.matrics[matric_key(e["matric"])] += 1
+
+    def remove(self, e):
+        for counter, key in ((self.names, self._name(e)), (self.matrics, matric_key(e["matric"]))):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+
+    def has_name(self, surname, first, middle, ignore=None, cohort=None):
+        """
+        True if another entry of `cohort` has this name. `ignore` is the entry
+        being edited; its cohort tag is used when `cohort` is not given.
+        """
+        if cohort is None and ignore is not None:
+            cohort = ignore.get("cohort")
+        key = cohort, name_key(surname, first, middle)
+        own = ignore is not None and self._name(ignore) == key
+        return self.names.get(key, 0) > (1 if own else 0)
+
+    def has_matric(self, matric, ignore=None):
+        key = matric_key(matric)
+        own = ignore is not None and matric_key(ignore["matric"]) == key
+        return self.matrics.get(key, 0) > (1 if own else 0)
 
 def now_str():  return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 def date_str(): return datetime.now().strftime("%Y-%m-%d")